@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides local stores for article (headline) objects as
+    returned by the TinyTinyRSS API, indexed by article id and feed id:
+    ArticleStore keeps them in memory, SQLiteArticleStore on disk.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import json
+import os.path
+import sqlite3
+import threading
+import time
+
+class ArticleStore(object):
+    """
+    In-memory store of headline dicts, keyed by article id with a secondary
+    index by feed id.
+    """
+    def __init__(self):
+        self.articles = {}
+        self.feeds = {}
+
+    def __len__(self):
+        return len(self.articles)
+
+    def __contains__(self, article_id):
+        return article_id in self.articles
+
+    def __iter__(self):
+        return iter(self.articles.values())
+
+    def get(self, article_id):
+        """ Return the article with id 'article_id' or None. """
+        return self.articles.get(article_id)
+
+    def add(self, article):
+        """ Insert or replace an article. """
+        old = self.articles.get(article['id'])
+        if old is not None and old.get('feed_id') != article.get('feed_id'):
+            self._unindex(old)
+        self.articles[article['id']] = article
+        self.feeds.setdefault(article.get('feed_id'), set()).add(article['id'])
+
+    def update(self, article_id, **fields):
+        """ Update fields of a stored article, e.g. update(42, unread=False). """
+        article = self.articles.get(article_id)
+        if article is not None:
+            article.update(fields)
+        return article
+
+    def remove(self, article_id):
+        """ Remove an article, returning it (or None if it was unknown). """
+        article = self.articles.pop(article_id, None)
+        if article is not None:
+            self._unindex(article)
+        return article
+
+    def _unindex(self, article):
+        ids = self.feeds.get(article.get('feed_id'))
+        if ids is not None:
+            ids.discard(article['id'])
+            if not ids:
+                del self.feeds[article.get('feed_id')]
+
+    def ids(self):
+        """ Return the set of all known article ids. """
+        return set(self.articles)
+
+    def known_feeds(self):
+        """ Return the ids of all feeds with stored articles. """
+        return list(self.feeds)
+
+    def feed_ids(self, feed_id):
+        """ Return the set of known article ids in feed 'feed_id'. """
+        return set(self.feeds.get(feed_id, ()))
+
+    def by_feed(self, feed_id):
+        """ Return the known articles of feed 'feed_id'. """
+        return [self.articles[article_id] for article_id in self.feeds.get(feed_id, ())]
+
+    def unread(self, feed_id=None):
+        """ Return unread articles (of one feed, or all), newest id first. """
+        if feed_id is None:
+            articles = self.articles.values()
+        else:
+            articles = self.by_feed(feed_id)
+        return sorted([article for article in articles if article.get('unread', True)],
+                      key=lambda article: article['id'], reverse=True)
+
+    def unread_count(self, feed_id):
+        """ Return the number of unread articles stored for feed 'feed_id'. """
+        return sum(1 for article in self.by_feed(feed_id) if article.get('unread', True))
+
+    def max_id(self):
+        """ Return the highest known article id (0 if the store is empty). """
+        return max(self.articles) if self.articles else 0
+
+    def clear(self):
+        """ Remove all articles. """
+        self.articles.clear()
+        self.feeds.clear()
+
+    def commit(self):
+        """ Persist pending changes (nothing to do for the in-memory store). """
+        pass
+
+class SQLiteArticleStore(object):
+    """
+    Persistent article store in an SQLite database, with the same interface
+    as ArticleStore. Article bodies ('content') are stored next to the
+    headlines, and feed and category lists can be kept with put_feeds() and
+    put_categories().
+    Parameters:
+        * path (string) - database file, created if missing
+        * max_bytes (integer) - when the stored articles grow beyond this
+          size, read and then oldest articles are evicted
+    Changes are written on commit() and close().
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS articles (
+            id INTEGER PRIMARY KEY, feed_id INTEGER, unread INTEGER,
+            updated INTEGER, headline TEXT, content TEXT, size INTEGER);
+        CREATE INDEX IF NOT EXISTS articles_feed ON articles (feed_id);
+        CREATE INDEX IF NOT EXISTS articles_unread ON articles (unread);
+        CREATE INDEX IF NOT EXISTS articles_updated ON articles (updated);
+        CREATE TABLE IF NOT EXISTS metadata (
+            name TEXT PRIMARY KEY, data TEXT, stored REAL);
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript(self.SCHEMA)
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM articles").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM articles")[0][0]
+
+    def __contains__(self, article_id):
+        return bool(self._query("SELECT 1 FROM articles WHERE id = ?", (article_id,)))
+
+    def __iter__(self):
+        return iter(self._articles("SELECT headline, content FROM articles"))
+
+    def _query(self, sql, args=()):
+        with self.lock:
+            return self.db.execute(sql, args).fetchall()
+
+    def _articles(self, sql, args=()):
+        articles = []
+        for headline, content in self._query(sql, args):
+            article = json.loads(headline)
+            if content is not None:
+                article['content'] = content
+            articles.append(article)
+        return articles
+
+    def get(self, article_id):
+        """ Return the article with id 'article_id' or None. """
+        articles = self._articles("SELECT headline, content FROM articles WHERE id = ?",
+                                  (article_id,))
+        return articles[0] if articles else None
+
+    def add(self, article):
+        """
+        Insert or replace an article (a dict or models.Article). A stored
+        body is kept when the new article comes without 'content'.
+        """
+        headline = article.to_dict() if hasattr(article, "to_dict") else dict(article)
+        content = headline.pop('content', None)
+        encoded = json.dumps(headline)
+        with self.lock:
+            row = self.db.execute("SELECT content, size FROM articles WHERE id = ?",
+                                  (article['id'],)).fetchone()
+            if row is not None:
+                self.size -= row[1]
+                if content is None:
+                    content = row[0]
+            size = len(encoded) + len(content or "")
+            self.db.execute("INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (article['id'], article.get('feed_id'),
+                             int(bool(article.get('unread', True))),
+                             article.get('updated'), encoded, content, size))
+            self.size += size
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """ Delete read, then the oldest articles until below max_bytes. """
+        target = self.max_bytes * 0.9
+        rows = self.db.execute("SELECT id, size FROM articles ORDER BY unread, updated, id")
+        evicted = []
+        for article_id, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((article_id,))
+            self.size -= size
+        self.db.executemany("DELETE FROM articles WHERE id = ?", evicted)
+
+    def update(self, article_id, **fields):
+        """ Update fields of a stored article, e.g. update(42, unread=False). """
+        with self.lock:
+            article = self.get(article_id)
+            if article is not None:
+                article.update(fields)
+                self.add(article)
+            return article
+
+    def remove(self, article_id):
+        """ Remove an article, returning it (or None if it was unknown). """
+        with self.lock:
+            article = self.get(article_id)
+            if article is not None:
+                self.size -= self.db.execute("SELECT size FROM articles WHERE id = ?",
+                                             (article_id,)).fetchone()[0]
+                self.db.execute("DELETE FROM articles WHERE id = ?", (article_id,))
+            return article
+
+    def ids(self):
+        """ Return the set of all known article ids. """
+        return set(row[0] for row in self._query("SELECT id FROM articles"))
+
+    def known_feeds(self):
+        """ Return the ids of all feeds with stored articles. """
+        return [row[0] for row in self._query("SELECT DISTINCT feed_id FROM articles")]
+
+    def feed_ids(self, feed_id):
+        """ Return the set of known article ids in feed 'feed_id'. """
+        return set(row[0] for row in
+                   self._query("SELECT id FROM articles WHERE feed_id = ?", (feed_id,)))
+
+    def by_feed(self, feed_id):
+        """ Return the known articles of feed 'feed_id'. """
+        return self._articles("SELECT headline, content FROM articles WHERE feed_id = ?",
+                              (feed_id,))
+
+    def unread(self, feed_id=None):
+        """ Return unread articles (of one feed, or all), newest id first. """
+        if feed_id is None:
+            return self._articles("SELECT headline, content FROM articles "
+                                  "WHERE unread = 1 ORDER BY id DESC")
+        return self._articles("SELECT headline, content FROM articles "
+                              "WHERE unread = 1 AND feed_id = ? ORDER BY id DESC", (feed_id,))
+
+    def unread_count(self, feed_id):
+        """ Return the number of unread articles stored for feed 'feed_id'. """
+        return self._query("SELECT COUNT(*) FROM articles WHERE unread = 1 AND feed_id = ?",
+                           (feed_id,))[0][0]
+
+    def max_id(self):
+        """ Return the highest known article id (0 if the store is empty). """
+        return self._query("SELECT COALESCE(MAX(id), 0) FROM articles")[0][0]
+
+    def clear(self):
+        """ Remove all articles. """
+        with self.lock:
+            self.db.execute("DELETE FROM articles")
+            self.size = 0
+
+    def _put_metadata(self, name, data):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+                            (name, json.dumps(data), time.time()))
+
+    def _get_metadata(self, name, max_age):
+        rows = self._query("SELECT data, stored FROM metadata WHERE name = ?", (name,))
+        if not rows or (max_age is not None and rows[0][1] < time.time() - max_age):
+            return None
+        return json.loads(rows[0][0])
+
+    def put_feeds(self, feeds):
+        """ Store a feed list as returned by getFeeds. """
+        self._put_metadata("feeds", feeds)
+
+    def get_feeds(self, max_age=None):
+        """ Return the stored feed list, or None if missing or older than max_age. """
+        return self._get_metadata("feeds", max_age)
+
+    def put_categories(self, categories):
+        """ Store a category list as returned by getCategories. """
+        self._put_metadata("categories", categories)
+
+    def get_categories(self, max_age=None):
+        """ Return the stored categories, or None if missing or older than max_age. """
+        return self._get_metadata("categories", max_age)
+
+    def commit(self):
+        """ Write pending changes to disk. """
+        with self.lock:
+            self.db.commit()
+
+    def close(self):
+        """ Commit and close the database. """
+        with self.lock:
+            self.db.commit()
+            self.db.close()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides AsyncTinyTinyRSS, a concurrent twin of the
+    TinyTinyRSS class which runs API calls on a bounded pool of worker
+    threads sharing one HTTP connection pool.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+from multiprocessing.pool import ThreadPool
+from ttrss import TinyTinyRSS, HTTPTransport
+
+API_METHODS = ("getApiLevel", "getVersion", "isLoggedIn", "getUnread",
+               "getCounters", "getFeeds", "getCategories", "getHeadlines",
+               "updateArticle", "getArticle", "getConfig", "updateFeed",
+               "getPref", "catchupFeed", "getLabels", "setArticleLabel",
+               "shareToPublished", "subscribeToFeed", "unsubscribeFeed",
+               "getFeedTree")
+
+class AsyncTinyTinyRSS(object):
+    """
+    Concurrent wrapper around the TinyTinyRSS REST API.
+    All API methods of TinyTinyRSS are available with the same parameters,
+    but return immediately with a multiprocessing.pool.AsyncResult; call
+    get() on it (or pass several to gather()) to wait for the value.
+    At most 'concurrency' requests are in flight at any time, all of them
+    sharing the connection pool of a single logged-in TinyTinyRSS client.
+    E.g. to fetch the headlines of all feeds at once:
+        feeds = client.getFeeds(cat_id=-3).get()
+        headlines = client.gather(*[client.getHeadlines(feed_id=feed['id'])
+                                    for feed in feeds])
+    """
+    def __init__(self, conn, concurrency=8, transport=None):
+        if transport is None:
+            options = dict(conn.get('transport', {}))
+            options.setdefault('pool_size', concurrency)
+            transport = HTTPTransport(**options)
+        self.client = TinyTinyRSS(conn, transport)
+        self.pool = ThreadPool(concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Wait for all pending requests, then stop the workers and close the
+        client (logging out unless the session is kept in a session file).
+        """
+        self.pool.close()
+        self.pool.join()
+        self.client.__exit__(None, None, None)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) on the worker pool, returning an AsyncResult.
+        """
+        return self.pool.apply_async(func, args, kwargs)
+
+    @staticmethod
+    def gather(*results):
+        """
+        Wait for all given AsyncResults and return their values as a list, in
+        the given order. The first failed request raises its exception.
+        """
+        return [result.get() for result in results]
+
+    def map(self, method, kwargs_list):
+        """
+        Call the API method named 'method' once per keyword argument dict in
+        'kwargs_list' concurrently and return the list of results, e.g.
+        client.map("getHeadlines", [{"feed_id": 1}, {"feed_id": 2}])
+        """
+        func = getattr(self.client, method)
+        return self.gather(*[self.submit(func, **kwargs) for kwargs in kwargs_list])
+
+def _async_method(name):
+    def method(self, *args, **kwargs):
+        return self.submit(getattr(self.client, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(TinyTinyRSS, name).__doc__
+    return method
+
+for _name in API_METHODS:
+    setattr(AsyncTinyTinyRSS, _name, _async_method(_name))
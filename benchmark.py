@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark the TinyTinyRSS client against a local fake server.
+
+Every scenario runs in a forked process against a fresh synthetic dataset,
+served from a separate process so that the client's peak memory is measured
+without it, and reports throughput, request latency percentiles and peak
+memory. Results can be saved as JSON and compared against an earlier run to
+catch regressions.
+
+(c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from fakeserver import Dataset, FakeServer
+from instrumentation import RequestStats, percentile
+from ttrss import TinyTinyRSS
+from responsecache import ResponseCache
+from writequeue import WriteQueue
+from syncengine import SyncEngine
+from bulkfetch import ArticleFetcher
+
+def backlog(ttrss, articles, args):
+    """ Page through the whole unread backlog. """
+    return sum(1 for _ in ttrss.iter_headlines(feed_id=-4, view_mode="unread"))
+
+def bulk_mark_read(ttrss, articles, args):
+    """ Mark the whole unread backlog as read through a WriteQueue. """
+    ids = [article_id for article_id, unread in articles.items() if unread]
+    with WriteQueue(ttrss) as queue:
+        queue.updateArticle(ids, 0, 2)
+    return len(ids)
+
+def bulk_fetch(ttrss, articles, args):
+    """ Fetch the full text of all articles. """
+    with ArticleFetcher(ttrss) as fetcher:
+        return sum(1 for _ in fetcher.iter_articles(articles))
+
+def metadata(ttrss, articles, args):
+    """ Poll the feed list, categories, config and counters. """
+    for _ in range(args.rounds):
+        ttrss.getFeeds(cat_id=-3)
+        ttrss.getCategories()
+        ttrss.getConfig()
+        ttrss.getCounters()
+    return args.rounds
+
+def metadata_cached(ttrss, articles, args):
+    """ Like metadata, with a ResponseCache enabled. """
+    ttrss.cache = ResponseCache()
+    return metadata(ttrss, articles, args)
+
+def gtk_poll(ttrss, articles, args):
+    """
+    Run the status icon poll loop: a SyncEngine tick per round, with new
+    articles arriving and a few articles being read every fifth round.
+    """
+    engine = SyncEngine(ttrss)
+    engine.sync()
+    for tick in range(args.rounds):
+        if tick % 5 == 4:
+            ttrss.rest({"op": "addArticles", "count": 3})
+            engine.mark_read([article['id'] for article in engine.unread()[:3]])
+        engine.sync()
+    return args.rounds
+
+SCENARIOS = [backlog, bulk_mark_read, bulk_fetch, metadata, metadata_cached, gtk_poll]
+
+def _serve(args, pipe):
+    """
+    Serve a fresh dataset until told to stop, sending the connection details
+    and the {article id: unread} state of the dataset first.
+    """
+    dataset = Dataset(args.feeds, args.articles, args.unread, args.content_size)
+    server = FakeServer(dataset, args.latency / 1000.0, args.jitter / 1000.0).start()
+    pipe.send((server.conn(), dict((article_id, article['unread'])
+                                   for article_id, article in dataset.articles.items())))
+    pipe.recv()
+    server.stop()
+    pipe.close()
+
+def _run_child(scenario, conn, articles, args, pipe):
+    durations = []
+    stats = RequestStats()
+    ttrss = TinyTinyRSS(conn)
+    ttrss.post_hooks.append(stats)
+    ttrss.post_hooks.append(lambda call: durations.append(call['duration']))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    items = scenario(ttrss, articles, args)
+    elapsed = time.time() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ttrss.logout()
+    pipe.send({"scenario": scenario.__name__, "items": items, "seconds": elapsed,
+               "throughput": items / elapsed if elapsed else None,
+               "requests": len(durations),
+               "p50": percentile(durations, 0.50),
+               "p95": percentile(durations, 0.95),
+               "p99": percentile(durations, 0.99),
+               "peak_rss_kb": rss_after, "rss_growth_kb": rss_after - rss_before,
+               "ops": stats.summary()})
+    pipe.close()
+
+def run(scenario, args):
+    """ Run 'scenario' in a child process against a fresh fake server. """
+    control, server_end = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve, args=(args, server_end))
+    server.start()
+    try:
+        conn, articles = control.recv()
+        receiver, sender = multiprocessing.Pipe(False)
+        child = multiprocessing.Process(target=_run_child,
+                                        args=(scenario, conn, articles, args, sender))
+        child.start()
+        result = receiver.recv()
+        child.join()
+    finally:
+        control.send("stop")
+        server.join()
+    return result
+
+def report(results):
+    """ Format results as a table. """
+    lines = ["{:<16} {:>7} {:>8} {:>10} {:>6} {:>7} {:>7} {:>7} {:>9}".format(
+        "scenario", "items", "seconds", "items/s", "reqs", "p50 ms", "p95 ms", "p99 ms",
+        "peak KB")]
+    for result in results:
+        lines.append("{:<16} {:>7} {:>8.3f} {:>10.1f} {:>6} {:>7.1f} {:>7.1f} {:>7.1f} {:>9}"
+                     .format(result['scenario'], result['items'], result['seconds'],
+                             result['throughput'] or 0, result['requests'],
+                             (result['p50'] or 0) * 1000, (result['p95'] or 0) * 1000,
+                             (result['p99'] or 0) * 1000, result['peak_rss_kb']))
+    return "\n".join(lines)
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of regressions of 'results' against 'baseline': throughput
+    dropping or peak memory growing by more than 'tolerance' (a fraction).
+    """
+    previous = dict((result['scenario'], result) for result in baseline)
+    regressions = []
+    for result in results:
+        old = previous.get(result['scenario'])
+        if old is None:
+            continue
+        if old['throughput'] and result['throughput'] < old['throughput'] * (1 - tolerance):
+            regressions.append("{}: throughput {:.1f}/s < {:.1f}/s".format(
+                result['scenario'], result['throughput'], old['throughput']))
+        if result['peak_rss_kb'] > old['peak_rss_kb'] * (1 + tolerance):
+            regressions.append("{}: peak memory {} KB > {} KB".format(
+                result['scenario'], result['peak_rss_kb'], old['peak_rss_kb']))
+    return regressions
+
+def main():
+    """ Parse the command line, run the selected scenarios and report. """
+    names = [scenario.__name__ for scenario in SCENARIOS]
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='Scenarios to run (default: all of {})'.format(", ".join(names)))
+    parser.add_argument('-f', '--feeds', type=int, default=50, help='Number of feeds')
+    parser.add_argument('-a', '--articles', type=int, default=5000, help='Number of articles')
+    parser.add_argument('--unread', type=float, default=0.8, help='Fraction of unread articles')
+    parser.add_argument('--content-size', type=int, default=2000,
+                        help='Characters of content per article')
+    parser.add_argument('-l', '--latency', type=float, default=5,
+                        help='Server latency per request in milliseconds')
+    parser.add_argument('-j', '--jitter', type=float, default=0,
+                        help='Additional random latency in milliseconds')
+    parser.add_argument('-r', '--rounds', type=int, default=50,
+                        help='Rounds of the polling scenarios')
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file')
+    parser.add_argument('-c', '--compare', help='Compare with results from this JSON file')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2,
+                        help='Allowed relative regression when comparing')
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(names)
+    if unknown:
+        parser.error("unknown scenario: {}".format(", ".join(sorted(unknown))))
+
+    selected = [s for s in SCENARIOS if not args.scenarios or s.__name__ in args.scenarios]
+    results = [run(scenario, args) for scenario in selected]
+    print report(results)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as infile:
+            regressions = compare(results, json.load(infile), args.tolerance)
+        for regression in regressions:
+            print "REGRESSION", regression
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides ArticleFetcher, which retrieves large numbers of full
+    articles via getArticle in parallel, chunked requests.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+from multiprocessing.pool import ThreadPool
+from articlestore import ArticleStore
+
+class ArticleFetcher(object):
+    """
+    Bulk getArticle client.
+    Requested ids are split into chunks of 'chunk_size', which are fetched
+    concurrently by 'workers' threads sharing the connection pool of 'ttrss'.
+    Fetched articles are kept in 'store' (an ArticleStore or
+    SQLiteArticleStore), and ids already held there with their content are
+    not requested again.
+    """
+    def __init__(self, ttrss, store=None, chunk_size=50, workers=4):
+        self.ttrss = ttrss
+        self.store = store if store is not None else ArticleStore()
+        self.chunk_size = chunk_size
+        self.pool = ThreadPool(workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Stop the worker threads. """
+        self.pool.close()
+        self.pool.join()
+
+    def _fetch_chunk(self, chunk):
+        return self.ttrss.getArticle(chunk) or []
+
+    def iter_articles(self, article_ids):
+        """
+        Yield the articles with the given ids. Cached articles come first,
+        the rest as soon as their chunk arrives (in no particular order).
+        Unknown ids are silently skipped.
+        """
+        missing = []
+        for article_id in sorted(set(article_ids)):
+            article = self.store.get(article_id)
+            if article is not None and article.get('content') is not None:
+                yield article
+            else:
+                missing.append(article_id)
+        chunks = [missing[start:start + self.chunk_size]
+                  for start in range(0, len(missing), self.chunk_size)]
+        for articles in self.pool.imap_unordered(self._fetch_chunk, chunks):
+            for article in articles:
+                self.store.add(article)
+                yield article
+        self.store.commit()
+
+    def fetch(self, article_ids):
+        """ Return the articles with the given ids as an {id: article} dict. """
+        return dict((article['id'], article) for article in self.iter_articles(article_ids))
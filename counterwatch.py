@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides CounterWatcher, which detects changes on a
+    TinyTinyRSS instance by polling only the feed counters and notifies
+    subscribers about feeds whose unread count moved.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+from syncengine import feed_counters
+
+class CounterWatcher(object):
+    """
+    Change detection based on getCounters.
+    Every poll() requests the per-feed unread counters and compares them to
+    the previous snapshot. For each feed whose count changed, the unread
+    headlines of just that feed are fetched and passed to the subscribed
+    callbacks as callback(feed_id, count, headlines). Headlines are only
+    requested if a subscriber is interested in the feed, and not at all for
+    feeds without unread articles. The first poll() only takes the initial
+    snapshot.
+    Parameters:
+        * ttrss (TinyTinyRSS) - the connection to watch
+        * headline_args (dict) - additional arguments for getHeadlines
+    """
+    def __init__(self, ttrss, headline_args=None):
+        self.ttrss = ttrss
+        self.headline_args = headline_args or {}
+        self.counters = None
+        self.subscribers = []
+
+    def subscribe(self, callback, feed_ids=None):
+        """
+        Call 'callback' for changed feeds, either all of them or only those
+        in 'feed_ids'.
+        """
+        if feed_ids is not None:
+            feed_ids = set(feed_ids)
+        self.subscribers.append((callback, feed_ids))
+
+    def unsubscribe(self, callback):
+        """ Stop calling 'callback'. """
+        self.subscribers = [(subscriber, feed_ids) for subscriber, feed_ids in self.subscribers
+                            if subscriber != callback]
+
+    def _interested(self, feed_id):
+        return [callback for callback, feed_ids in self.subscribers
+                if feed_ids is None or feed_id in feed_ids]
+
+    def poll(self):
+        """
+        Check the counters and notify subscribers. Returns the changes as a
+        {feed_id: (old count, new count)} dict.
+        """
+        counters = feed_counters(self.ttrss)
+        previous, self.counters = self.counters, counters
+        if previous is None:
+            return {}
+        changes = dict((feed_id, (previous.get(feed_id, 0), counters.get(feed_id, 0)))
+                       for feed_id in set(previous) | set(counters)
+                       if previous.get(feed_id, 0) != counters.get(feed_id, 0))
+        for feed_id, (_, count) in sorted(changes.items()):
+            callbacks = self._interested(feed_id)
+            if not callbacks:
+                continue
+            headlines = []
+            if count:
+                args = dict(self.headline_args)
+                args.update(feed_id=feed_id, view_mode="unread")
+                headlines = list(self.ttrss.iter_headlines(**args))
+            for callback in callbacks:
+                callback(feed_id, count, headlines)
+        return changes
+
+    def unread(self):
+        """ Return the total unread count of the last snapshot (None before the first poll). """
+        if self.counters is None:
+            return None
+        return sum(self.counters.values())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for a TinyTinyRSS server, serving a synthetic dataset through
+the subset of the API used by ttrss.py. Intended for benchmarks and offline
+experiments, not as a faithful reimplementation.
+
+(c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+class Dataset(object):
+    """
+    Synthetic feeds and articles. Article ids increase with their date, the
+    newest article has the highest id.
+    Parameters:
+        * feeds (integer) - number of feeds
+        * articles (integer) - number of articles
+        * unread (float) - fraction of articles which start out unread
+        * content_size (integer) - length of each article's content
+        * seed - random seed, for reproducible datasets
+    """
+    def __init__(self, feeds=50, articles=5000, unread=0.8, content_size=2000, seed=0):
+        self.random = random.Random(seed)
+        self.content_size = content_size
+        self.feeds = [{"id": feed_id, "title": u"Feed {}".format(feed_id),
+                       "feed_url": "http://example.com/{}/rss".format(feed_id),
+                       "cat_id": feed_id % 5, "has_icon": False,
+                       "last_updated": 0, "order_id": 0}
+                      for feed_id in range(1, feeds + 1)]
+        self.articles = {}
+        self.lock = threading.Lock()
+        for _ in range(articles):
+            self.add_article(self.random.random() < unread)
+
+    def add_article(self, unread=True):
+        """ Add a new article to a random feed, returning it. """
+        with self.lock:
+            article_id = len(self.articles) + 1
+            feed = self.random.choice(self.feeds)
+            words = " ".join("word{}".format(self.random.randint(0, 5000))
+                             for _ in range(self.content_size // 9))
+            self.articles[article_id] = {
+                "id": article_id, "guid": "guid-{}".format(article_id),
+                "title": u"Article {} of {}".format(article_id, feed['title']),
+                "link": "http://example.com/article/{}".format(article_id),
+                "feed_id": feed['id'], "feed_title": feed['title'],
+                "unread": unread, "marked": False, "published": False,
+                "updated": 1500000000 + article_id * 60, "author": "",
+                "labels": [], "tags": [""], "score": 0, "note": None,
+                "is_updated": False, "always_display_attachments": False,
+                "comments_count": 0, "comments_link": "", "lang": "en",
+                "attachments": [], "site_url": "http://example.com/",
+                "excerpt": words[:100], "content": words[:self.content_size]}
+            return self.articles[article_id]
+
+    def headlines(self, feed_id=-4, view_mode="all_articles", since_id=0):
+        """ Return matching articles, newest first. """
+        with self.lock:
+            articles = self.articles.values()
+        if feed_id is not None and feed_id > 0:
+            articles = [a for a in articles if a['feed_id'] == feed_id]
+        elif feed_id == -1:
+            articles = [a for a in articles if a['marked']]
+        elif feed_id == -2:
+            articles = [a for a in articles if a['published']]
+        if view_mode == "unread":
+            articles = [a for a in articles if a['unread']]
+        elif view_mode == "marked":
+            articles = [a for a in articles if a['marked']]
+        if since_id:
+            articles = [a for a in articles if a['id'] > since_id]
+        return sorted(articles, key=lambda a: a['id'], reverse=True)
+
+    def unread_counts(self):
+        """ Return a {feed_id: unread count} dict. """
+        counts = dict((feed['id'], 0) for feed in self.feeds)
+        with self.lock:
+            for article in self.articles.values():
+                if article['unread']:
+                    counts[article['feed_id']] += 1
+        return counts
+
+class APIError(Exception):
+    """ Error reported to the client with status 1. """
+    pass
+
+class FakeAPI(object):
+    """ Implements the API operations on top of a Dataset. """
+    FIELDS = {0: "marked", 1: "published", 2: "unread"}
+    HEADLINE_FIELDS = ("id", "guid", "title", "link", "feed_id", "feed_title",
+                       "unread", "marked", "published", "updated", "author",
+                       "labels", "tags", "score", "note", "is_updated",
+                       "always_display_attachments", "comments_count",
+                       "comments_link", "lang", "attachments", "site_url")
+
+    def __init__(self, dataset, user=None, password=None):
+        self.dataset = dataset
+        self.user = user
+        self.password = password
+        self.sessions = set()
+        self.lock = threading.Lock()
+
+    def call(self, req):
+        """ Execute request 'req', returning the response content. """
+        op = req.get("op")
+        if op not in ("login", "getApiLevel", "getVersion", "isLoggedIn") \
+                and req.get("sid") not in self.sessions:
+            raise APIError("NOT_LOGGED_IN")
+        handler = getattr(self, "op_" + str(op), None)
+        if handler is None:
+            raise APIError("UNKNOWN_METHOD")
+        return handler(req)
+
+    def op_login(self, req):
+        if self.user is not None and (req.get("user"), req.get("password")) != \
+                (self.user, self.password):
+            raise APIError("LOGIN_ERROR")
+        with self.lock:
+            session_id = "fake{}".format(len(self.sessions) + random.randint(0, 1 << 30))
+            self.sessions.add(session_id)
+        return {"session_id": session_id, "api_level": 14}
+
+    def op_logout(self, req):
+        with self.lock:
+            self.sessions.discard(req.get("sid"))
+        return {"status": "OK"}
+
+    def op_isLoggedIn(self, req):
+        return {"status": req.get("sid") in self.sessions}
+
+    def op_getApiLevel(self, _):
+        return {"level": 14}
+
+    def op_getVersion(self, _):
+        return {"version": "17.4-fake"}
+
+    def op_getConfig(self, _):
+        return {"icons_dir": "feed-icons", "icons_url": "feed-icons",
+                "daemon_is_running": True, "num_feeds": len(self.dataset.feeds)}
+
+    def op_getUnread(self, _):
+        return {"unread": sum(self.dataset.unread_counts().values())}
+
+    def op_getCounters(self, _):
+        counts = self.dataset.unread_counts()
+        counters = [{"id": feed_id, "counter": count, "has_img": 0, "updated": ""}
+                    for feed_id, count in sorted(counts.items())]
+        counters.append({"id": "global-unread", "counter": sum(counts.values())})
+        return counters
+
+    def op_getFeeds(self, req):
+        counts = self.dataset.unread_counts()
+        feeds = []
+        for feed in self.dataset.feeds:
+            if req.get("cat_id") not in (None, -3, -4) and feed['cat_id'] != req['cat_id']:
+                continue
+            if req.get("unread_only") and not counts[feed['id']]:
+                continue
+            feed = dict(feed)
+            feed['unread'] = counts[feed['id']]
+            feeds.append(feed)
+        offset = req.get("offset") or 0
+        return feeds[offset:offset + req['limit']] if req.get("limit") else feeds[offset:]
+
+    def op_getCategories(self, _):
+        return [{"id": cat_id, "title": u"Category {}".format(cat_id), "unread": 0,
+                 "order_id": 0} for cat_id in range(5)]
+
+    def op_getLabels(self, _):
+        return []
+
+    def _headline(self, article, req):
+        headline = dict((k, article[k]) for k in self.HEADLINE_FIELDS)
+        if req.get("show_excerpt"):
+            headline['excerpt'] = article['excerpt']
+        if req.get("show_content"):
+            headline['content'] = article['content']
+        return headline
+
+    def op_getHeadlines(self, req):
+        articles = self.dataset.headlines(req.get("feed_id"), req.get("view_mode"),
+                                          req.get("since_id"))
+        skip = req.get("skip") or 0
+        limit = min(req.get("limit") or 200, 200)
+        return [self._headline(article, req) for article in articles[skip:skip + limit]]
+
+    def op_getArticle(self, req):
+        ids = [int(article_id) for article_id in str(req.get("article_id", "")).split(",")
+               if article_id]
+        articles = []
+        for article_id in ids:
+            article = self.dataset.articles.get(article_id)
+            if article is not None:
+                article = dict(article)
+                article['attachments'] = []
+                articles.append(article)
+        return articles
+
+    def op_updateArticle(self, req):
+        field = self.FIELDS.get(int(req.get("field", 0)))
+        mode = int(req.get("mode", 0))
+        updated = 0
+        with self.dataset.lock:
+            for article_id in str(req.get("article_ids", "")).split(","):
+                article = self.dataset.articles.get(int(article_id)) if article_id else None
+                if article is None or field is None:
+                    continue
+                value = not article[field] if mode == 2 else bool(mode)
+                if article[field] != value:
+                    article[field] = value
+                    updated += 1
+        return {"status": "OK", "updated": updated}
+
+    def op_catchupFeed(self, req):
+        with self.dataset.lock:
+            for article in self.dataset.articles.values():
+                if article['feed_id'] == req.get("feed_id"):
+                    article['unread'] = False
+        return {"status": "OK"}
+
+    def op_updateFeed(self, _):
+        return {"status": "OK"}
+
+    def op_addArticles(self, req):
+        """ Not part of the real API: add 'count' new unread articles. """
+        articles = [self.dataset.add_article() for _ in range(int(req.get("count", 1)))]
+        return {"status": "OK", "ids": [article['id'] for article in articles]}
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """ HTTP front end for FakeAPI, answering POSTed JSON requests. """
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+    def do_POST(self): # pylint: disable=invalid-name
+        length = int(self.headers.get("Content-Length", 0))
+        req = json.loads(self.rfile.read(length) or "{}")
+        server = self.server
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.random() * server.jitter)
+        try:
+            body = {"seq": req.get("seq", 0), "status": 0, "content": server.api.call(req)}
+        except APIError as error:
+            body = {"seq": req.get("seq", 0), "status": 1, "content": {"error": str(error)}}
+        with server.lock:
+            server.requests += 1
+        payload = json.dumps(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+class FakeServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded fake TinyTinyRSS server on localhost.
+    Parameters:
+        * dataset (Dataset) - data to serve (default: a new Dataset())
+        * latency (float) - seconds to delay every response
+        * jitter (float) - additional random delay of up to this many seconds
+        * port (integer) - port to listen on (default: any free port)
+    Call start() to serve in a background thread; 'url' is then the API
+    endpoint to put into the TinyTinyRSS connection details.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, dataset=None, latency=0.0, jitter=0.0, port=0,
+                 user=None, password=None):
+        HTTPServer.__init__(self, ("127.0.0.1", port), FakeHandler)
+        self.dataset = dataset if dataset is not None else Dataset()
+        self.api = FakeAPI(self.dataset, user, password)
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        """ The API endpoint URL. """
+        return "http://127.0.0.1:{}/api/".format(self.server_address[1])
+
+    def conn(self):
+        """ Return connection details for TinyTinyRSS. """
+        return {"url": self.url, "user": self.api.user or "admin",
+                "password": self.api.password or "password"}
+
+    def start(self):
+        """ Serve requests in a background thread. """
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """ Stop serving and close the socket. """
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-P', '--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('-f', '--feeds', type=int, default=50, help='Number of feeds')
+    parser.add_argument('-a', '--articles', type=int, default=5000, help='Number of articles')
+    parser.add_argument('-l', '--latency', type=float, default=0,
+                        help='Response latency in milliseconds')
+    args = parser.parse_args()
+    server = FakeServer(Dataset(args.feeds, args.articles), args.latency / 1000.0,
+                        port=args.port)
+    print "Serving fake TinyTinyRSS API at", server.url
+    server.serve_forever()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides FederatedTinyTinyRSS, which queries several
+    TinyTinyRSS instances concurrently and merges their results.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import heapq
+import itertools
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from ttrss import TinyTinyRSS
+
+class FederatedTinyTinyRSS(object):
+    """
+    Client for several TinyTinyRSS servers at once.
+    'conns' is a list of connection details as taken by TinyTinyRSS, each
+    optionally with a 'name' (defaulting to its url). All servers are
+    queried concurrently, so a federated call takes as long as the slowest
+    server instead of the sum of all of them.
+    Headlines are merged newest first (by 'updated') and carry the name of
+    their server in article['server'], which updateArticle uses to send
+    changes back to the right instance.
+    """
+    def __init__(self, conns):
+        self.pool = ThreadPool(len(conns))
+        names = [conn.get('name') or conn['url'] for conn in conns]
+        self.clients = OrderedDict(zip(names, self.pool.map(TinyTinyRSS, conns)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Log out of all servers and stop the worker threads. """
+        self.pool.map(lambda client: client.__exit__(None, None, None),
+                      self.clients.values())
+        self.pool.close()
+        self.pool.join()
+
+    def map(self, method, *args, **kwargs):
+        """
+        Call API method 'method' with the given arguments on all servers
+        concurrently, returning an OrderedDict of {server name: result}.
+        """
+        def call(name):
+            return getattr(self.clients[name], method)(*args, **kwargs)
+        return OrderedDict(zip(self.clients, self.pool.map(call, self.clients)))
+
+    def getUnread(self):
+        """ Returns the total number of unread articles on all servers. """
+        return sum(int(unread) for unread in self.map("getUnread").values())
+
+    def getCounters(self, output_mode="flc"):
+        """
+        Returns the counters of all servers as {server name: counters}, see
+        TinyTinyRSS.getCounters.
+        """
+        return self.map("getCounters", output_mode)
+
+    @staticmethod
+    def _tag(articles, name):
+        for article in articles:
+            if isinstance(article, dict):
+                article['server'] = name
+            else:
+                article.update({'server': name})
+            yield article
+
+    @staticmethod
+    def _merge(streams):
+        """ Merge article streams, each sorted newest first, into one. """
+        counter = itertools.count()
+        keyed = [((-(article.get('updated') or 0), next(counter), article)
+                  for article in stream) for stream in streams]
+        for _, _, article in heapq.merge(*keyed):
+            yield article
+
+    def getHeadlines(self, **kwargs):
+        """
+        Returns the headlines of all servers (see TinyTinyRSS.getHeadlines
+        for the parameters) as one list, newest first. 'limit' applies per
+        server.
+        """
+        kwargs.setdefault('order_by', "feed_dates")
+        headlines = self.map("getHeadlines", **kwargs)
+        return list(self._merge([self._tag(articles, name)
+                                 for name, articles in headlines.items()]))
+
+    def iter_headlines(self, **kwargs):
+        """
+        Lazily iterate over the headlines of all servers, newest first (see
+        TinyTinyRSS.iter_headlines for the parameters). The first page of
+        every server is requested concurrently.
+        """
+        kwargs.setdefault('order_by', "feed_dates")
+
+        def first(name):
+            stream = self._tag(self.clients[name].iter_headlines(**kwargs), name)
+            return list(itertools.islice(stream, 1)), stream
+        primed = self.pool.map(first, self.clients)
+        for article in self._merge([itertools.chain(head, stream)
+                                    for head, stream in primed]):
+            yield article
+
+    def updateArticle(self, articles, mode, field, data=None):
+        """
+        Update articles on their servers, see TinyTinyRSS.updateArticle.
+        'articles' are headlines returned by this class, or (server name,
+        article id) tuples. Returns the total number of updated articles.
+        """
+        by_server = OrderedDict()
+        for article in articles:
+            if isinstance(article, tuple):
+                name, article_id = article
+            else:
+                name, article_id = article['server'], article['id']
+            by_server.setdefault(name, []).append(article_id)
+
+        def update(name):
+            return self.clients[name].updateArticle(by_server[name], mode, field, data)
+        return sum(self.pool.map(update, by_server))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides FeedBatch, which runs many feed maintenance calls
+    (catchupFeed, updateFeed, subscribeToFeed, unsubscribeFeed) concurrently
+    with a limit per operation.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from multiprocessing.pool import ThreadPool
+
+# Default number of concurrent calls per operation. updateFeed makes the
+# server fetch the feed, so fewer of them run at once.
+DEFAULT_LIMITS = {"catchupFeed": 8, "updateFeed": 4, "subscribeToFeed": 2,
+                  "unsubscribeFeed": 4}
+
+class BatchReport(object):
+    """
+    Outcome of FeedBatch.run(): 'results' lists one dict per queued call,
+    in queue order, with the keys op, args, ok, result, error and duration
+    (seconds); 'elapsed' is the wall clock time of the whole batch.
+    """
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def succeeded(self):
+        """ Results of the calls which completed. """
+        return [result for result in self.results if result['ok']]
+
+    @property
+    def failed(self):
+        """ Results of the calls which raised an error. """
+        return [result for result in self.results if not result['ok']]
+
+    def summary(self):
+        """ Return a one-line description of the batch. """
+        return "{} calls, {} failed, {:.1f}s".format(
+            len(self.results), len(self.failed), self.elapsed)
+
+class FeedBatch(object):
+    """
+    Batch executor for feed maintenance.
+    Calls are queued with the methods named like the TinyTinyRSS ones, and
+    executed by run() on 'workers' threads sharing the connection pool of
+    'ttrss'. At most limits[op] calls of each operation are in flight at
+    the same time (DEFAULT_LIMITS for operations not given). A failing call
+    does not stop the batch; its error is reported instead.
+    E.g. to refresh and then catch up a list of feeds:
+        batch = FeedBatch(client)
+        for feed_id in feed_ids:
+            batch.updateFeed(feed_id)
+        print(batch.run().summary())
+    """
+    def __init__(self, ttrss, workers=8, limits=None):
+        self.ttrss = ttrss
+        self.workers = workers
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.queue = []
+
+    def __len__(self):
+        return len(self.queue)
+
+    def add(self, op, *args, **kwargs):
+        """ Queue a call of TinyTinyRSS method 'op' with the given arguments. """
+        self.queue.append((op, args, kwargs))
+
+    def catchupFeed(self, feed_id, is_cat=False):
+        """ Queue marking a feed (or category) as read. """
+        self.add("catchupFeed", feed_id, is_cat)
+
+    def updateFeed(self, feed_id):
+        """ Queue a server-side update of a feed. """
+        self.add("updateFeed", feed_id)
+
+    def subscribeToFeed(self, feed_url, login="", password="", category_id=0):
+        """ Queue subscribing to a feed. """
+        self.add("subscribeToFeed", feed_url, login, password, category_id)
+
+    def unsubscribeFeed(self, feed_id):
+        """ Queue unsubscribing a feed. """
+        self.add("unsubscribeFeed", feed_id)
+
+    def _call(self, index, op, args, kwargs):
+        start = time.time()
+        result = {"op": op, "args": args, "ok": True, "result": None, "error": None}
+        try:
+            result["result"] = getattr(self.ttrss, op)(*args, **kwargs)
+        except Exception as error: # pylint: disable=broad-except
+            result["ok"] = False
+            result["error"] = error
+        result["duration"] = time.time() - start
+        return index, result
+
+    def run(self):
+        """
+        Execute and clear the queued calls, returning a BatchReport once all
+        of them have finished.
+        """
+        queue, self.queue = self.queue, []
+        pending = OrderedDict()
+        for index, (op, args, kwargs) in enumerate(queue):
+            pending.setdefault(op, deque()).append((index, op, args, kwargs))
+        running = dict((op, 0) for op in pending)
+        results = [None] * len(queue)
+        done = threading.Condition()
+
+        def finished(outcome):
+            index, result = outcome
+            with done:
+                results[index] = result
+                running[result["op"]] -= 1
+                done.notify()
+
+        start = time.time()
+        pool = ThreadPool(self.workers)
+        try:
+            with done:
+                while pending or sum(running.values()):
+                    for op in list(pending):
+                        limit = self.limits.get(op) or self.workers
+                        while (pending[op] and running[op] < limit and
+                               sum(running.values()) < self.workers):
+                            running[op] += 1
+                            pool.apply_async(self._call, pending[op].popleft(),
+                                             callback=finished)
+                        if not pending[op]:
+                            del pending[op]
+                    done.wait()
+        finally:
+            pool.close()
+            pool.join()
+        return BatchReport(results, time.time() - start)
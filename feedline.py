@@ -5,13 +5,17 @@ Rapidly display fresh headlines from a TinyTinyRSS instance on the command line.
 
 (c) 2017 Andreas Fischer <_@ndreas.de>
 """
-import webbrowser
-import argparse
 import getpass
+import itertools
 import json
 import os.path
-import readchar
-from ttrss import TinyTinyRSS
+import sys
+from ttrss import TinyTinyRSS, Prefetch
+from writequeue import WriteQueue
+
+# Smaller than the iter_headlines default, so the first line shows up sooner;
+# further pages are fetched in the background while reading.
+PAGE_SIZE = 50
 
 def get_conn():
     """
@@ -22,31 +26,54 @@ def get_conn():
         with open('pyttrss.cfg', 'r') as cfgfile:
             conn = json.load(cfgfile)
 
-    parser = argparse.ArgumentParser(description=__doc__,
-                                     formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument('-u', '--user', help='Username')
-    parser.add_argument('-p', '--password', help='Password')
-    parser.add_argument('-U', '--url', help='Server URL')
-    args = parser.parse_args()
+    args = None
+    if len(sys.argv) > 1:
+        # Only pay for importing argparse if there is something to parse
+        import argparse
+        parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument('-u', '--user', help='Username')
+        parser.add_argument('-p', '--password', help='Password')
+        parser.add_argument('-U', '--url', help='Server URL')
+        args = parser.parse_args()
 
     # Preference: Commandline > Configfile > User input
-    conn['user'] = args.user or conn['user'] or raw_input("Enter username: ")
-    conn['password'] = args.password or conn['password'] or getpass.getpass()
-    conn['url'] = args.url or conn['url'] or raw_input("Enter server URL: ")
+    conn['user'] = (args and args.user) or conn.get('user') or raw_input("Enter username: ")
+    conn['password'] = (args and args.password) or conn.get('password') or getpass.getpass()
+    conn['url'] = (args and args.url) or conn.get('url') or raw_input("Enter server URL: ")
     return conn
 
+def main():
+    """
+    Show the unread articles one by one. The unread count and the first page
+    of headlines are requested concurrently, and the first headline is
+    printed as soon as its page arrives.
+    """
+    # Marking articles read while still paging through the unread list would
+    # shift the skip offsets, so only flush (in chunks) when done.
+    with TinyTinyRSS(get_conn()) as ttrss, \
+            WriteQueue(ttrss, max_pending=None, max_delay=None) as queue:
+        unread = Prefetch(ttrss.getUnread)
+        headlines = ttrss.iter_headlines(page_size=PAGE_SIZE, feed_id=-4, view_mode="unread")
+        first = next(headlines, None)
+        print "Unread articles:", unread.result()
+        if first is None:
+            return
+        import readchar
+        try:
+            for article in itertools.chain([first], headlines):
+                print u"{:>20} | {}".format(article['feed_title'][:20], article['title'])
+                char = readchar.readchar()
+                if char == "o":
+                    import webbrowser
+                    webbrowser.open(article['link'], 2, False)
+                elif char == "s":
+                    continue
+                elif char == "q":
+                    break
+                queue.updateArticle(article['id'], 0, 2)
+        finally:
+            headlines.close()
+
 if __name__ == "__main__":
-    with TinyTinyRSS(get_conn()) as ttrss:
-        print "Unread articles:", ttrss.getUnread()
-        read_art_ids = []
-        for article in ttrss.getHeadlines(feed_id=-4, view_mode="unread"):
-            print u"{:>20} | {}".format(article['feed_title'][:20], article['title'])
-            char = readchar.readchar()
-            if char == "o":
-                webbrowser.open(article['link'], 2, False)
-            elif char == "s":
-                continue
-            elif char == "q":
-                break
-            read_art_ids.append(article['id'])
-        ttrss.updateArticle(read_art_ids, 0, 2)
+    main()
@@ -8,42 +8,98 @@ line icon.
 (c) 2017 Andreas Fischer <_@ndreas.de>
 """
 
+import threading
+import time
+import gobject
 import gtk
 import webbrowser
 from feedline import get_conn
 from ttrss import TinyTinyRSS
+from syncengine import SyncEngine
+from articlestore import SQLiteArticleStore
+
+# Seconds between refreshes, and the limit when backing off from a slow or
+# failing server.
+REFRESH_INTERVAL = 60
+MAX_REFRESH_INTERVAL = 15 * 60
+# A refresh taking longer than this many seconds counts as slow.
+SLOW_REFRESH = 10
+
+# Changing more rows than this detaches the model from the view while updating.
+BULK_UPDATE = 100
 
 class ArticleViewer(object):
+    """
+    Window listing unread articles.
+    The list model and view are created once and kept up to date by update(),
+    which only inserts, removes or changes the rows that differ from the
+    given articles.
+    """
     def __init__(self):
         self.window = gtk.Window(gtk.WINDOW_TOPLEVEL)
         self.window.set_type_hint(gtk.gdk.WINDOW_TYPE_HINT_DIALOG)
         self.window.set_title("Unread article list")
+        self.window.set_default_size(600, 400)
         #self.window.set_geometry_hints(None, min_width=100, min_height=100, max_width=100, max_height=100)
-        self.window.connect("destroy", self.hide)
+        self.window.connect("delete-event", self.hide)
         #self.window.connect("key_press_event", self.on_key_pressed)
-        self.read = []
+        self.read = set()
+        # Article id -> (row iter, title shown). The title is kept because
+        # the store hands back UTF-8 encoded str, not the unicode title.
+        self.rows = {}
+        self.liststore = gtk.ListStore(str, str, int, int)
+        self.treeview = gtk.TreeView(self.liststore)
+        self.tvcolumn = gtk.TreeViewColumn('Articles: 0')
+        self.tvcolumn.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+        self.treeview.append_column(self.tvcolumn)
+        self.treeview.set_fixed_height_mode(True)
+        cell = gtk.CellRendererText()
+        self.tvcolumn.pack_start(cell, True)
+        self.tvcolumn.add_attribute(cell, 'text', 0)
+        self.tvcolumn.add_attribute(cell, 'weight', 3)
+        self.treeview.connect("row-activated", self.open_article, self.liststore)
+        self.treeview.connect("cursor-changed", self.skip_article, self.liststore)
+        scrolled = gtk.ScrolledWindow()
+        scrolled.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scrolled.add(self.treeview)
+        self.window.add(scrolled)
+
+    def update(self, articles):
+        """
+        Make the list show 'articles' (in the given order), changing only the
+        rows which differ.
+        """
+        ids = set(article['id'] for article in articles)
+        removed = [artid for artid in self.rows if artid not in ids]
+        bulk = len(removed) + len(ids) - (len(self.rows) - len(removed)) > BULK_UPDATE
+        if bulk:
+            self.treeview.set_model(None)
+        for artid in removed:
+            self.liststore.remove(self.rows.pop(artid)[0])
+            self.read.discard(artid)
+        for position, article in enumerate(articles):
+            row = self.rows.get(article['id'])
+            if row is None:
+                weight = 400 if article['id'] in self.read else 700
+                treeiter = self.liststore.insert(
+                    position, [article['title'], article['link'], article['id'], weight])
+                self.rows[article['id']] = (treeiter, article['title'])
+            elif row[1] != article['title']:
+                self.liststore.set_value(row[0], 0, article['title'])
+                self.rows[article['id']] = (row[0], article['title'])
+        if bulk:
+            self.treeview.set_model(self.liststore)
+        self.tvcolumn.set_title('Articles: {}'.format(len(self.rows)))
 
     def show(self, articles):
-        treestore = gtk.TreeStore(str, str, str, int)
-        for article in articles:
-            entry = [article['title'], article['link'], article['id'], 700]
-            treestore.append(None, entry)
-        treeview = gtk.TreeView(treestore)
-        tvcolumn = gtk.TreeViewColumn('Articles: {}'.format(len(articles)))
-        treeview.append_column(tvcolumn)
-        cell = gtk.CellRendererText()
-        tvcolumn.pack_start(cell, True)
-        tvcolumn.add_attribute(cell, 'text', 0)
-        tvcolumn.add_attribute(cell, 'weight', 3)
-        self.window.add(treeview)
+        self.update(articles)
         self.window.set_position(gtk.WIN_POS_CENTER_ON_PARENT)
-        treeview.connect("row-activated", self.open_article, treestore)
-        treeview.connect("cursor-changed", self.skip_article, treestore)
         self.window.show_all()
 
-    def hide(self, event):
+    def hide(self, *args):
         self.window.hide()
         self.on_hide()
+        return True
 
     def on_hide(self):
         pass
@@ -55,28 +111,39 @@ class ArticleViewer(object):
         elif key == "space":
             pass
 
-    def open_article(self, treeview, path, view_column, treestore):
-        treeiter = treestore.get_iter(path)
-        url = treestore.get_value(treeiter, 1)
+    def open_article(self, treeview, path, view_column, liststore):
+        treeiter = liststore.get_iter(path)
+        url = liststore.get_value(treeiter, 1)
         webbrowser.open(url)
         a = path[0]
         treeview.set_cursor((a+1))
-        treestore.set_value(treeiter, 3, 400)
-        artid = treestore.get_value(treeiter, 2)
-        if artid not in self.read:
-            self.read.append(artid)
+        liststore.set_value(treeiter, 3, 400)
+        self.read.add(liststore.get_value(treeiter, 2))
 
-    def skip_article(self, treeview, treestore):
+    def skip_article(self, treeview, liststore):
         path, _ = treeview.get_cursor()
-        treeiter = treestore.get_iter(path)
-        treestore.set_value(treeiter, 3, 400)
-        artid = treestore.get_value(treeiter, 2)
-        if artid not in self.read:
-            self.read.append(artid)
+        if path is None:
+            return
+        treeiter = liststore.get_iter(path)
+        liststore.set_value(treeiter, 3, 400)
+        self.read.add(liststore.get_value(treeiter, 2))
 
 class FeedIcon(object):
-    def __init__(self, ttrss):
+    """
+    Status icon showing the number of unread articles.
+    Network requests run on a worker thread, one refresh at a time, and their
+    results are handed back to the GTK main loop via gobject.idle_add. The
+    refresh interval doubles (up to MAX_REFRESH_INTERVAL) while the server is
+    slow or failing.
+    """
+    def __init__(self, ttrss, store=None):
         self.ttrss = ttrss
+        self.sync = SyncEngine(ttrss, store)
+        self.headlines = self.sync.unread()
+        self.pending_read = set()
+        self.refreshing = False
+        self.interval = REFRESH_INTERVAL
+        self.to = None
         self.menu = gtk.Menu()
         quitter = gtk.ImageMenuItem(gtk.STOCK_QUIT)
         quitter.set_always_show_image(True)
@@ -86,32 +153,89 @@ class FeedIcon(object):
         self.viewer = ArticleViewer()
         self.viewer.on_hide = self.update_articles
         self.status_icon = gtk.StatusIcon()
-        self.status_icon.set_from_icon_name("mail-read")
+        self.status_icon.set_from_icon_name("mail-unread" if self.headlines else "mail-read")
+        self.status_icon.set_tooltip_text("Unread articles: {} (updating...)"
+                                          .format(len(self.headlines)))
         self.update_headlines()
-        self.to = gtk.timeout_add(1000 * 60, self.update_headlines)
         self.status_icon.connect("activate", self.toggle_viewer)
         self.status_icon.connect("popup-menu", self.show_menu)
 
     def update_articles(self):
-        ids = self.viewer.read
-        self.ttrss.updateArticle(ids, 0, 2)
-        self.viewer.read = []
-        gtk.timeout_remove(self.to)
+        """
+        Mark the articles read in the viewer as read on the server.
+        """
+        self.pending_read.update(self.viewer.read)
+        self.viewer.read = set()
         self.update_headlines()
-        self.to = gtk.timeout_add(1000 * 60, self.update_headlines)
 
     def update_headlines(self):
         """
-        Get all unread headlines from the server.
+        Start synchronizing the unread headlines with the server in the
+        background, unless a refresh is already running.
         """
-        self.headlines = self.ttrss.getHeadlines(feed_id=-4, view_mode="unread")
-        count = len(self.headlines)
-        if count > 0:
-            self.status_icon.set_from_icon_name("mail-unread")
+        if self.to is not None:
+            gobject.source_remove(self.to)
+            self.to = None
+        if self.refreshing:
+            return False
+        self.refreshing = True
+        read_ids, self.pending_read = self.pending_read, set()
+        worker = threading.Thread(target=self.refresh, args=(read_ids,))
+        worker.daemon = True
+        worker.start()
+        return False
+
+    def refresh(self, read_ids):
+        """
+        Worker thread: send read articles and sync headlines, then pass the
+        outcome (and the read ids which could not be sent) on to the main loop.
+        """
+        start = time.time()
+        headlines, error = None, None
+        try:
+            if read_ids:
+                self.sync.mark_read(read_ids)
+                read_ids = set()
+            self.sync.sync()
+            headlines = self.sync.unread()
+        except Exception as err: # pylint: disable=broad-except
+            error = err
+        gobject.idle_add(self.refresh_done, headlines, error, read_ids,
+                         time.time() - start)
+
+    def refresh_done(self, headlines, error, read_ids, duration):
+        """
+        Main loop: show the refresh results and schedule the next refresh.
+        """
+        self.refreshing = False
+        if error is not None:
+            self.pending_read.update(read_ids)
+            self.interval = min(self.interval * 2, MAX_REFRESH_INTERVAL)
+            self.status_icon.set_tooltip_text("Unread articles: {} (update failed: {})"
+                                              .format(len(self.headlines), error))
         else:
-            self.status_icon.set_from_icon_name("mail-read")
-        self.status_icon.set_tooltip_text("Unread articles: {}".format(count))
-        return True
+            if duration > SLOW_REFRESH:
+                self.interval = min(self.interval * 2, MAX_REFRESH_INTERVAL)
+            else:
+                self.interval = REFRESH_INTERVAL
+            self.headlines = headlines
+            count = len(self.headlines)
+            if count > 0:
+                self.status_icon.set_from_icon_name("mail-unread")
+            else:
+                self.status_icon.set_from_icon_name("mail-read")
+            self.status_icon.set_tooltip_text("Unread articles: {}".format(count))
+            if self.viewer.window.get_visible():
+                self.viewer.update(self.headlines)
+        if self.pending_read and error is None:
+            self.update_headlines()
+        else:
+            self.to = gobject.timeout_add_seconds(self.interval, self.on_timeout)
+        return False
+
+    def on_timeout(self):
+        self.to = None
+        return self.update_headlines()
 
     def toggle_viewer(self, event):
         if self.viewer.window.get_visible():
@@ -124,6 +248,14 @@ class FeedIcon(object):
 
 if __name__ == "__main__":
     conn = get_conn()
+    # Retry failed requests and back off from a failing server by default
+    conn.setdefault('policy', {})
     ttrss = TinyTinyRSS(conn)
-    feedicon = FeedIcon(ttrss)
+    gobject.threads_init()
+    # Optionally cache articles on disk for a warm start, e.g.
+    # "store": "~/.cache/pyttrss.db" in pyttrss.cfg
+    store = SQLiteArticleStore(conn['store']) if conn.get('store') else None
+    feedicon = FeedIcon(ttrss, store)
     gtk.main()
+    if store is not None:
+        store.close()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides instrumentation hooks for TinyTinyRSS: RequestStats
+    aggregates per-operation counts and latencies, TraceSink records every
+    call to a JSON-lines file which can be replayed with replay().
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import json
+import threading
+import time
+from collections import deque
+
+# Request parameters which are never written to a trace.
+SECRET_PARAMS = ("sid", "password")
+
+def percentile(values, fraction):
+    """ Return the nearest-rank percentile 'fraction' (0..1) of 'values'. """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = int(round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+class RequestStats(object):
+    """
+    Post hook aggregating calls per operation.
+    Install with ttrss.post_hooks.append(stats). Latency percentiles are
+    computed from the last 'samples' calls of each operation.
+    """
+    def __init__(self, samples=1000):
+        self.samples = samples
+        self.ops = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, call):
+        with self.lock:
+            stats = self.ops.get(call['op'])
+            if stats is None:
+                stats = self.ops[call['op']] = {
+                    "count": 0, "errors": 0, "bytes": 0, "time": 0.0,
+                    "durations": deque(maxlen=self.samples)}
+            stats["count"] += 1
+            stats["bytes"] += call['bytes']
+            stats["time"] += call['duration']
+            stats["durations"].append(call['duration'])
+            if call['status'] != "ok":
+                stats["errors"] += 1
+
+    def summary(self):
+        """
+        Return a dict mapping each operation to a dict with count, errors,
+        bytes, total time and p50/p95/p99 latency (in seconds).
+        """
+        with self.lock:
+            result = {}
+            for op, stats in self.ops.items():
+                durations = list(stats["durations"])
+                result[op] = {"count": stats["count"], "errors": stats["errors"],
+                              "bytes": stats["bytes"], "time": stats["time"],
+                              "p50": percentile(durations, 0.50),
+                              "p95": percentile(durations, 0.95),
+                              "p99": percentile(durations, 0.99)}
+            return result
+
+    def report(self):
+        """ Return the summary as a human-readable table. """
+        lines = ["{:<20} {:>7} {:>6} {:>10} {:>8} {:>8} {:>8}".format(
+            "op", "count", "errors", "bytes", "p50 ms", "p95 ms", "p99 ms")]
+        for op, stats in sorted(self.summary().items()):
+            lines.append("{:<20} {:>7} {:>6} {:>10} {:>8.1f} {:>8.1f} {:>8.1f}".format(
+                op, stats["count"], stats["errors"], stats["bytes"],
+                stats["p50"] * 1000, stats["p95"] * 1000, stats["p99"] * 1000))
+        return "\n".join(lines)
+
+    def reset(self):
+        """ Forget all collected data. """
+        with self.lock:
+            self.ops.clear()
+
+class TraceSink(object):
+    """
+    Post hook writing one JSON object per call to the file 'path' (or an
+    open file object). Session ids and passwords are left out.
+    """
+    def __init__(self, path):
+        if hasattr(path, "write"):
+            self.file = path
+        else:
+            self.file = open(path, "a")
+        self.lock = threading.Lock()
+
+    def __call__(self, call):
+        record = dict(call)
+        record["params"] = dict((k, v) for k, v in call['params'].items()
+                                if k not in SECRET_PARAMS)
+        line = json.dumps(record, sort_keys=True)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        """ Close the trace file. """
+        self.file.close()
+
+def read_trace(path):
+    """ Yield the call records of a JSON-lines trace file. """
+    with open(path) as tracefile:
+        for line in tracefile:
+            if line.strip():
+                yield json.loads(line)
+
+def replay(path, ttrss, speed=1.0):
+    """
+    Replay the calls recorded in trace file 'path' against 'ttrss', keeping
+    the original spacing between calls divided by 'speed' (0 replays as fast
+    as possible). login and logout calls are skipped. Returns the number of
+    calls made.
+    """
+    count = 0
+    first = None
+    began = time.time()
+    for record in read_trace(path):
+        if record['op'] in ("login", "logout"):
+            continue
+        if first is None:
+            first = record['start']
+        if speed:
+            delay = (record['start'] - first) / speed - (time.time() - began)
+            if delay > 0:
+                time.sleep(delay)
+        try:
+            ttrss.rest(dict(record['params']))
+        except Exception: # pylint: disable=broad-except
+            pass
+        count += 1
+    return count
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides incremental decoding of TinyTinyRSS API responses,
+    so the elements of a large 'content' array can be processed one at a time
+    while the response is still being received.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import codecs
+import json
+
+WHITESPACE = u" \t\n\r"
+DECODER = json.JSONDecoder()
+
+class StreamReader(object):
+    """
+    Incrementally decodes a JSON response envelope (an object such as
+    {"seq": 0, "status": 0, "content": [...]}) from an iterable of byte
+    chunks. Only the undecoded rest of the current value is buffered.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = u""
+        self.pos = 0
+        self.bytes = 0
+        self.eof = False
+
+    def _read(self):
+        """ Return the next decoded text (possibly empty), or None at end of input. """
+        if self.eof:
+            return None
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            return self.decoder.decode(b"", True)
+        self.bytes += len(chunk)
+        return self.decoder.decode(chunk)
+
+    def _fill(self, wanted=1):
+        """
+        Append at least 'wanted' characters (fewer at the end of input) to
+        the buffer, dropping everything before pos. Returns False if nothing
+        could be added.
+        """
+        parts = [self.buf[self.pos:]]
+        size = 0
+        while size < wanted:
+            text = self._read()
+            if text is None:
+                break
+            parts.append(text)
+            size += len(text)
+        self.buf = u"".join(parts)
+        self.pos = 0
+        return size > 0
+
+    def _peek(self):
+        """ Skip whitespace and return the next character (None at the end). """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return None
+
+    def _next(self, expected=None):
+        """ Consume and return the next non-whitespace character. """
+        char = self._peek()
+        if char is None or (expected is not None and char not in expected):
+            raise ValueError("Invalid JSON response: expected {!r}, got {!r}"
+                             .format(expected, char))
+        self.pos += 1
+        return char
+
+    def _value(self):
+        """ Decode the complete JSON value starting at the next character. """
+        while True:
+            char = self._peek()
+            if char is None:
+                raise ValueError("Truncated JSON response")
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+            except ValueError as error:
+                # Usually just incomplete; only an error once all input is read.
+                # Reading as much again as is buffered keeps the total work
+                # of re-decoding a large value linear.
+                if self.eof:
+                    raise ValueError("Invalid or truncated JSON response: {}".format(error))
+                self._fill(max(len(self.buf) - self.pos, 1))
+                continue
+            # A number or literal at the end of the buffer may continue
+            if end < len(self.buf) or self.eof or char in u'"[{':
+                self.pos = end
+                return value
+            self._fill(max(len(self.buf) - self.pos, 1))
+
+    def events(self):
+        """
+        Yield (key, value) pairs for the members of the envelope, in the order
+        received. If 'content' is an array, its elements are yielded as
+        ("item", element) pairs instead, followed by ("content", None).
+        """
+        self._next(u"{")
+        if self._peek() == u"}":
+            return
+        while True:
+            key = self._value()
+            self._next(u":")
+            if key == "content" and self._peek() == u"[":
+                self._next()
+                if self._peek() == u"]":
+                    self._next()
+                else:
+                    while True:
+                        yield "item", self._value()
+                        if self._next(u",]") == u"]":
+                            break
+                yield "content", None
+            else:
+                yield key, self._value()
+            if self._next(u",}") == u"}":
+                return
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides compact model classes for the objects returned by
+    the TinyTinyRSS API, as an alternative to the raw decoded JSON dicts.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+
+_INTERNED = {}
+
+def _intern(value):
+    """ Share one instance of frequently repeated strings (e.g. feed titles). """
+    if value is None:
+        return None
+    return _INTERNED.setdefault(value, value)
+
+class Model(object):
+    """
+    Base class of all models. Known fields are stored in __slots__, unknown
+    ones in the 'extra' dict. Fields can also be read dict-style, so models
+    can be used in place of the raw dicts, e.g. article['title']. Fields the
+    server did not send stay unset: like with a dict, they are not 'in' the
+    model, get() returns the default and reading the attribute raises
+    AttributeError.
+    """
+    __slots__ = ("extra",)
+    FIELDS = ()
+
+    def __init__(self, data):
+        self.extra = None
+        self.update(data)
+
+    def update(self, data):
+        """ Set fields from the dict 'data'. """
+        for key, value in data.items():
+            if key in self.FIELDS:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self.FIELDS:
+            return hasattr(self, key)
+        return self.extra is not None and key in self.extra
+
+    def get(self, key, default=None):
+        """ Return field 'key', or 'default' if it does not exist. """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """ Return the model as a plain dict, as returned by the API. """
+        data = dict(self.extra or {})
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                data[field] = getattr(self, field)
+        return data
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self.get('id'))
+
+    @classmethod
+    def from_list(cls, items):
+        """ Convert a list of API dicts into a list of models. """
+        return [cls(item) for item in items]
+
+class Article(Model):
+    """
+    An article (headline). The heavy 'content' and 'excerpt' fields are kept
+    UTF-8 encoded and only decoded when accessed.
+    """
+    __slots__ = ("id", "guid", "title", "link", "feed_id", "_feed_title",
+                 "unread", "marked", "published", "updated", "author", "score",
+                 "note", "lang", "tags", "labels", "attachments",
+                 "comments_count", "comments_link", "is_updated",
+                 "always_display_attachments", "flavor_image", "flavor_stream",
+                 "site_url", "_content", "_excerpt")
+    FIELDS = ("id", "guid", "title", "link", "feed_id", "feed_title", "unread",
+              "marked", "published", "updated", "author", "score", "note",
+              "lang", "tags", "labels", "attachments", "comments_count",
+              "comments_link", "is_updated", "always_display_attachments",
+              "flavor_image", "flavor_stream", "site_url", "content", "excerpt")
+
+    @property
+    def feed_title(self):
+        """ Title of the feed, shared among all articles of a feed. """
+        return self._feed_title
+
+    @feed_title.setter
+    def feed_title(self, value):
+        self._feed_title = _intern(value)
+
+    @property
+    def content(self):
+        """ Full article text, decoded on access. """
+        return self._content.decode("utf-8") if self._content is not None else None
+
+    @content.setter
+    def content(self, value):
+        self._content = value.encode("utf-8") if value is not None else None
+
+    @property
+    def excerpt(self):
+        """ Article excerpt, decoded on access. """
+        return self._excerpt.decode("utf-8") if self._excerpt is not None else None
+
+    @excerpt.setter
+    def excerpt(self, value):
+        self._excerpt = value.encode("utf-8") if value is not None else None
+
+class Feed(Model):
+    """ A subscribed feed, as returned by getFeeds. """
+    __slots__ = ("id", "_title", "feed_url", "cat_id", "unread", "has_icon",
+                 "last_updated", "order_id")
+    FIELDS = ("id", "title", "feed_url", "cat_id", "unread", "has_icon",
+              "last_updated", "order_id")
+
+    @property
+    def title(self):
+        """ Title of the feed. """
+        return self._title
+
+    @title.setter
+    def title(self, value):
+        self._title = _intern(value)
+
+class Category(Model):
+    """ A feed category, as returned by getCategories. """
+    __slots__ = ("id", "title", "unread", "order_id")
+    FIELDS = ("id", "title", "unread", "order_id")
+
+class Label(Model):
+    """ A label, as returned by getLabels. """
+    __slots__ = ("id", "caption", "fg_color", "bg_color", "checked")
+    FIELDS = ("id", "caption", "fg_color", "bg_color", "checked")
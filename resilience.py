@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides ResiliencePolicy, which decides when TinyTinyRSS
+    retries a failed request and how long it waits before doing so, and the
+    CircuitBreaker it uses to stop calling a failing server for a while.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import random
+import threading
+import time
+
+# Operations without side effects, retried after any transport error.
+READ_OPS = ("getApiLevel", "getVersion", "isLoggedIn", "getUnread",
+            "getCounters", "getFeeds", "getCategories", "getHeadlines",
+            "getArticle", "getConfig", "getPref", "getLabels", "getFeedTree")
+
+# Writes which have the same effect when repeated, also retried after any
+# transport error. updateArticle is only idempotent unless toggling (mode 2).
+IDEMPOTENT_OPS = ("setArticleLabel", "catchupFeed", "unsubscribeFeed",
+                  "updateFeed", "logout")
+
+# HTTP status codes worth retrying.
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+class CircuitBreaker(object):
+    """
+    Opens after 'failure_threshold' consecutive failures. While open, no
+    requests are allowed; after 'reset_timeout' seconds a single trial
+    request is let through (half open), which closes the breaker again on
+    success or re-opens it on failure. If the trial reports neither within
+    another 'reset_timeout' seconds, the next request becomes a new trial.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """ Return whether a request may be sent now. """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if time.time() - self.opened >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened = time.time()
+                return True
+            return False
+
+    def success(self):
+        """ Record a request which reached the server. """
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        """ Record a failed request. """
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened = time.time()
+
+class ResiliencePolicy(object):
+    """
+    Retry and circuit breaker settings for TinyTinyRSS.
+    Parameters:
+        * max_attempts (integer) - attempts per call, including the first
+        * base_delay (float) - seconds to wait before the first retry; the
+          limit doubles with every further retry
+        * max_delay (float) - upper limit for the wait between attempts
+        * failure_threshold (integer) - consecutive transport failures which
+          open the circuit breaker (None disables the breaker)
+        * reset_timeout (float) - seconds the breaker stays open
+    Waits are drawn uniformly between 0 and the current limit ("full
+    jitter"), so that many clients do not retry in lockstep.
+    Read operations (READ_OPS) and idempotent writes are retried after any
+    transport error; other writes only if the request was never sent. API
+    errors reported by the server are never retried.
+    """
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30.0,
+                 failure_threshold=5, reset_timeout=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = None
+        if failure_threshold is not None:
+            self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def retryable(self, data, error):
+        """ Return whether request 'data' may be repeated after TransportError 'error'. """
+        if error.status is not None and error.status not in RETRY_STATUS:
+            return False
+        if not error.sent:
+            return True
+        op = data.get("op")
+        if op in READ_OPS or op in IDEMPOTENT_OPS:
+            return True
+        return op == "updateArticle" and data.get("mode") != 2
+
+    def retry_delay(self, data, error, attempt):
+        """
+        Return the seconds to wait before repeating request 'data' after its
+        'attempt'-th attempt failed with 'error', or None to give up.
+        """
+        if attempt >= self.max_attempts or not self.retryable(data, error):
+            return None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def allow(self):
+        """ Return whether the circuit breaker lets a request through. """
+        return self.breaker is None or self.breaker.allow()
+
+    def success(self):
+        """ Record that the server was reached. """
+        if self.breaker is not None:
+            self.breaker.success()
+
+    def failure(self):
+        """ Record a transport failure. """
+        if self.breaker is not None:
+            self.breaker.failure()
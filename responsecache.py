@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides ResponseCache, an LRU cache with per-operation TTLs
+    for the rarely changing metadata calls of the TinyTinyRSS API.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a response stays valid, per API operation. Operations not listed
+# here are never cached.
+DEFAULT_TTLS = {
+    "getApiLevel": 3600,
+    "getVersion": 3600,
+    "getConfig": 60,
+    "getFeeds": 60,
+    "getCategories": 60,
+    "getFeedTree": 60,
+    "getLabels": 300,
+}
+
+# Operations whose results depend on the set of subscribed feeds.
+FEED_OPS = ("getFeeds", "getCategories", "getFeedTree", "getConfig")
+
+# Write operations and the cached operations they invalidate.
+INVALIDATED_BY = {
+    "subscribeToFeed": FEED_OPS,
+    "unsubscribeFeed": FEED_OPS,
+    "catchupFeed": ("getFeeds", "getCategories", "getFeedTree"),
+    "updateFeed": ("getFeeds", "getCategories", "getFeedTree"),
+    # These change the unread/published counters included in feed lists
+    "updateArticle": ("getFeeds", "getCategories", "getFeedTree"),
+    "shareToPublished": ("getFeeds", "getCategories", "getFeedTree"),
+    # Changes the 'checked' flag of getLabels(article_id=...)
+    "setArticleLabel": ("getLabels",),
+}
+
+class ResponseCache(object):
+    """
+    LRU cache of decoded API responses keyed by the normalized request
+    parameters (without the session id).
+    Parameters:
+        * ttls (dict) - seconds to cache each operation for, defaults to
+          DEFAULT_TTLS; set an operation to 0 to disable caching it
+        * max_entries (integer) - maximum number of cached responses
+        * max_bytes (integer) - maximum total size of the cached responses
+          (JSON-encoded)
+    Responses are stored JSON-encoded and decoded on every hit, so callers
+    may modify returned objects freely.
+    """
+    def __init__(self, ttls=None, max_entries=256, max_bytes=4 * 1024 * 1024):
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.num_feeds = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, data):
+        """
+        Return the cache key for request 'data', or None if its operation is
+        not cached.
+        """
+        if not self.ttls.get(data.get("op")):
+            return None
+        return json.dumps(dict((k, v) for k, v in data.items() if k != "sid"),
+                          sort_keys=True)
+
+    def get(self, key):
+        """ Return the cached response for 'key', or None. """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    self.size -= len(entry[2])
+                self.misses += 1
+                return None
+            self.entries[key] = entry
+            self.hits += 1
+        return json.loads(entry[2])
+
+    def put(self, key, op, response):
+        """
+        Cache 'response' of operation 'op'. A getConfig response reporting a
+        changed number of feeds invalidates all feed related entries.
+        """
+        if op == "getConfig":
+            num_feeds = response.get("content", {}).get("num_feeds")
+            if self.num_feeds is not None and num_feeds != self.num_feeds:
+                self.invalidate(FEED_OPS)
+            self.num_feeds = num_feeds
+        encoded = json.dumps(response)
+        if len(encoded) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[2])
+            self.entries[key] = (op, time.time() + self.ttls[op], encoded)
+            self.size += len(encoded)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, ops=None):
+        """ Drop cached responses of the operations 'ops' (default: all). """
+        with self.lock:
+            for key, (op, _, encoded) in list(self.entries.items()):
+                if ops is None or op in ops:
+                    del self.entries[key]
+                    self.size -= len(encoded)
+
+    def written(self, op):
+        """ Invalidate the entries affected by a call to write operation 'op'. """
+        if op in INVALIDATED_BY:
+            self.invalidate(INVALIDATED_BY[op])
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides SearchIndex, a local full-text index over articles
+    fetched from a TinyTinyRSS instance, queried without a server round trip.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import heapq
+import math
+import re
+from array import array
+from itertools import izip
+
+TAG = re.compile(r"<[^>]*>|&#?\w+;")
+WORD = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text):
+    """ Split text (plain or HTML) into lower case words. """
+    if not text:
+        return []
+    return WORD.findall(TAG.sub(u" ", text).lower())
+
+class SearchIndex(object):
+    """
+    Inverted index over article titles and contents, ranked with BM25.
+    Articles are added incrementally, e.g. as returned by
+    getHeadlines(show_content=True) or getArticle, or all articles of an
+    ArticleStore via add_all(store). Articles without 'content' are indexed
+    by title (and excerpt) until they are added again with their content.
+    Queries are words which all have to match. "OR" between words gives
+    alternatives, a leading "-" excludes articles containing a word:
+        index.search(u"python OR ruby -job", unread=True)
+    Postings are kept in compact arrays; removed or replaced articles are
+    skipped when searching and dropped once they make up half the index.
+    Parameters:
+        * title_weight (integer) - a title word counts like this many
+          content words
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, title_weight=3):
+        self.title_weight = title_weight
+        self.postings = {}
+        self.docs = {}
+        self.articles = {}
+        self.next_doc = 0
+        self.total_length = 0
+        self.live_postings = 0
+        self.dead_postings = 0
+
+    def __len__(self):
+        return len(self.articles)
+
+    def __contains__(self, article_id):
+        return article_id in self.articles
+
+    @staticmethod
+    def _labels(article):
+        # Headlines list labels as [id, caption, fg_color, bg_color]
+        return frozenset(label[0] if isinstance(label, (list, tuple)) else label
+                         for label in article.get('labels') or ())
+
+    def add(self, article):
+        """
+        Index an article, replacing an earlier version. If the new version
+        comes without content but the indexed one had it, only the feed,
+        labels and unread state are updated.
+        """
+        article_id = article['id']
+        has_content = bool(article.get('content'))
+        old = self.articles.get(article_id)
+        if old is not None and old['content'] and not has_content:
+            self.update(article_id, feed_id=article.get('feed_id'),
+                        labels=article.get('labels'), unread=article.get('unread', True))
+            return
+        self.remove(article_id)
+        counts = {}
+        for word in tokenize(article.get('title')):
+            counts[word] = counts.get(word, 0) + self.title_weight
+        text = article.get('content') if has_content else article.get('excerpt')
+        for word in tokenize(text):
+            counts[word] = counts.get(word, 0) + 1
+        doc = self.next_doc
+        self.next_doc += 1
+        for word, count in counts.iteritems():
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = (array('i'), array('i'))
+            posting[0].append(doc)
+            posting[1].append(count)
+        length = sum(counts.itervalues())
+        self.docs[doc] = article_id
+        self.articles[article_id] = {
+            'doc': doc, 'feed_id': article.get('feed_id'), 'labels': self._labels(article),
+            'unread': bool(article.get('unread', True)), 'length': length,
+            'terms': len(counts), 'content': has_content}
+        self.total_length += length
+        self.live_postings += len(counts)
+
+    def add_all(self, articles):
+        """ Index all articles of an iterable, e.g. an ArticleStore. """
+        for article in articles:
+            self.add(article)
+
+    def update(self, article_id, **fields):
+        """
+        Update the feed_id, labels or unread state of an indexed article
+        without re-indexing its text, e.g. update(42, unread=False).
+        """
+        info = self.articles.get(article_id)
+        if info is None:
+            return
+        if fields.get('feed_id') is not None:
+            info['feed_id'] = fields['feed_id']
+        if fields.get('labels') is not None:
+            info['labels'] = self._labels(fields)
+        if fields.get('unread') is not None:
+            info['unread'] = bool(fields['unread'])
+
+    def remove(self, article_id):
+        """ Remove an article from the index. """
+        info = self.articles.pop(article_id, None)
+        if info is None:
+            return
+        del self.docs[info['doc']]
+        self.total_length -= info['length']
+        self.live_postings -= info['terms']
+        self.dead_postings += info['terms']
+        if self.dead_postings > self.live_postings:
+            self.compact()
+
+    def compact(self):
+        """ Drop the postings of removed and replaced articles. """
+        docs = self.docs
+        for word, (doc_ids, counts) in self.postings.items():
+            live = [(doc, count) for doc, count in izip(doc_ids, counts) if doc in docs]
+            if live:
+                self.postings[word] = (array('i', [doc for doc, _ in live]),
+                                       array('i', [count for _, count in live]))
+            else:
+                del self.postings[word]
+        self.dead_postings = 0
+
+    def clear(self):
+        """ Remove all articles. """
+        self.__init__(self.title_weight)
+
+    def _matches(self, word):
+        """
+        Return {doc: count} of the articles containing 'word', including
+        removed ones (checked for by the caller).
+        """
+        posting = self.postings.get(word)
+        if posting is None:
+            return {}
+        return dict(izip(*posting))
+
+    @staticmethod
+    def _parse(query):
+        """
+        Split a query into alternatives, each a pair of (required words,
+        excluded words).
+        """
+        alternatives = [([], [])]
+        for token in query.split():
+            if token == "OR":
+                alternatives.append(([], []))
+            elif token.startswith("-"):
+                alternatives[-1][1].extend(tokenize(token[1:]))
+            else:
+                alternatives[-1][0].extend(tokenize(token))
+        return [(required, excluded) for required, excluded in alternatives
+                if required or excluded]
+
+    def search(self, query, feed_id=None, label_id=None, unread=None, limit=20):
+        """
+        Return the best matching articles as a list of (article_id, score)
+        tuples, best first.
+        Parameters:
+            * query (string) - words to search for, see above
+            * feed_id (integer) - only articles of this feed
+            * label_id (integer) - only articles with this label
+            * unread (bool) - only unread (True) or read (False) articles
+            * limit (integer) - maximum number of results (None for all)
+        """
+        if not self.articles:
+            return []
+        total = len(self.articles)
+        average = float(self.total_length) / total or 1.0
+        scores = {}
+        for required, excluded in self._parse(query):
+            matches = sorted((self._matches(word) for word in set(required)), key=len)
+            if matches:
+                candidates = set(matches[0])
+                for match in matches[1:]:
+                    candidates.intersection_update(match)
+            else:
+                candidates = set(self.docs)
+            for word in excluded:
+                candidates.difference_update(self._matches(word))
+            weights = [(match, math.log(1 + (total - len(match) + 0.5) / (len(match) + 0.5)))
+                       for match in matches]
+            for doc in candidates:
+                article_id = self.docs.get(doc)
+                if article_id is None:
+                    continue
+                info = self.articles[article_id]
+                if ((feed_id is not None and info['feed_id'] != feed_id) or
+                        (label_id is not None and label_id not in info['labels']) or
+                        (unread is not None and info['unread'] != unread)):
+                    continue
+                norm = self.K1 * (1 - self.B + self.B * info['length'] / average)
+                score = sum(idf * match[doc] * (self.K1 + 1) / (match[doc] + norm)
+                            for match, idf in weights)
+                scores[doc] = max(scores.get(doc, 0.0), score)
+        if limit is None:
+            best = sorted(scores.iteritems(), key=lambda item: item[1], reverse=True)
+        else:
+            best = heapq.nlargest(limit, scores.iteritems(), key=lambda item: item[1])
+        return [(self.docs[doc], value) for doc, value in best]
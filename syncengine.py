@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides SyncEngine, which keeps a local ArticleStore of
+    unread articles in sync with a TinyTinyRSS instance using since_id and
+    the feed counters instead of re-downloading all headlines.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+from articlestore import ArticleStore
+
+def feed_counters(ttrss):
+    """
+    Return the unread counters of all regular feeds (no virtual feeds,
+    categories or labels) as a {feed_id: count} dict.
+    """
+    counters = {}
+    for counter in ttrss.getCounters("f"):
+        feed_id = counter.get('id')
+        if isinstance(feed_id, int) and feed_id > 0 and not counter.get('kind'):
+            counters[feed_id] = counter.get('counter', 0)
+    return counters
+
+class SyncEngine(object):
+    """
+    Incrementally synchronizes the unread articles of a TinyTinyRSS instance
+    into 'store'.
+    The first sync() downloads all unread headlines, unless the store
+    already holds articles (e.g. a persistent SQLiteArticleStore from an
+    earlier run), which are then reconciled like below. Every following sync()
+    requests the per-feed unread counters; if they are unchanged nothing
+    else is fetched. Otherwise only articles newer than the newest known one
+    are fetched (since_id), and the unread headlines of feeds whose counter
+    still disagrees with the store are re-read to pick up articles read or
+    unread elsewhere.
+    """
+    def __init__(self, ttrss, store=None, headline_args=None):
+        self.ttrss = ttrss
+        self.store = store if store is not None else ArticleStore()
+        self.headline_args = headline_args or {}
+        self.counters = None
+
+    def _headlines(self, **kwargs):
+        args = dict(self.headline_args)
+        args.update(kwargs)
+        return self.ttrss.iter_headlines(view_mode="unread", **args)
+
+    def feed_counters(self):
+        """ Return the server's unread counters as a {feed_id: count} dict. """
+        return feed_counters(self.ttrss)
+
+    def sync(self):
+        """
+        Bring the store up to date. Returns a tuple (added, removed) of
+        article id sets changed by this call.
+        """
+        counters = self.feed_counters()
+        if self.counters is None:
+            if not len(self.store):
+                return self._full_sync(counters)
+            self.counters = {}
+        changed = set(feed_id for feed_id in set(counters) | set(self.counters)
+                      if counters.get(feed_id, 0) != self.counters.get(feed_id, 0))
+        changed.update(feed_id for feed_id in self.store.known_feeds()
+                       if isinstance(feed_id, int) and feed_id > 0 and
+                       counters.get(feed_id, 0) != self.store.unread_count(feed_id))
+        self.counters = counters
+        if not changed:
+            return set(), set()
+        try:
+            return self._sync_changes(counters, changed)
+        finally:
+            self.store.commit()
+
+    def _sync_changes(self, counters, changed):
+        """ Fetch new articles and reconcile the feeds in 'changed'. """
+        added = set()
+        for article in self._headlines(feed_id=-4, since_id=self.store.max_id()):
+            self.store.add(article)
+            added.add(article['id'])
+        removed = set()
+        for feed_id in changed:
+            if counters.get(feed_id, 0) != self.store.unread_count(feed_id):
+                feed_added, feed_removed = self._sync_feed(feed_id, counters.get(feed_id, 0))
+                added |= feed_added
+                removed |= feed_removed
+        return added, removed
+
+    def _full_sync(self, counters):
+        known = self.store.ids()
+        self.store.clear()
+        for article in self._headlines(feed_id=-4):
+            self.store.add(article)
+        self.store.commit()
+        self.counters = counters
+        current = self.store.ids()
+        return current - known, known - current
+
+    def _sync_feed(self, feed_id, count):
+        known = self.store.feed_ids(feed_id)
+        current = set()
+        if count:
+            for article in self._headlines(feed_id=feed_id):
+                current.add(article['id'])
+                if article['id'] not in known:
+                    self.store.add(article)
+        for article_id in known - current:
+            self.store.remove(article_id)
+        return current - known, known - current
+
+    def mark_read(self, article_ids):
+        """
+        Mark articles as read on the server and drop them from the store, so
+        the next sync() does not have to reconcile them.
+        """
+        article_ids = set(article_ids)
+        updated = self.ttrss.updateArticle(article_ids, 0, 2)
+        for article_id in article_ids:
+            self.store.remove(article_id)
+        self.store.commit()
+        return updated
+
+    def unread(self):
+        """ Return all unread articles in the store, newest first. """
+        return self.store.unread()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Tests for the incremental response decoder in jsonstream.py.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import json
+import unittest
+from jsonstream import StreamReader
+from ttrss import TinyTinyRSS, APIError
+
+def chunked(body, size):
+    """ Split byte string 'body' into chunks of 'size' bytes. """
+    return [body[start:start + size] for start in range(0, len(body), size)]
+
+def decode(body, size):
+    """ Return the events of 'body' read in chunks of 'size' bytes. """
+    return list(StreamReader(chunked(body, size)).events())
+
+class FakeResponse(object):
+    """ Just enough of requests.Response for TinyTinyRSS. """
+    status_code = 200
+
+    def __init__(self, data):
+        self.content = json.dumps(data).encode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, size):
+        return iter(chunked(self.content, size))
+
+    def close(self):
+        pass
+
+class FakeTransport(object):
+    """ Answers each API operation with a canned response. """
+    def __init__(self, responses):
+        self.responses = responses
+
+    def post(self, url, data, stream=False):
+        response = self.responses[data["op"]]
+        return FakeResponse(response(data) if callable(response) else response)
+
+    def close(self):
+        pass
+
+class StreamReaderTest(unittest.TestCase):
+    ENVELOPE = {"seq": 0, "status": 0, "content": [
+        {"id": 1, "title": u"Quotes \" and \\ backslashes\n", "score": -1.5e3},
+        {"id": 2, "title": u"Unicode: é ü ☃ \U0001F600", "tags": [], "note": None},
+        {"id": 12345678901, "labels": [[-1025, u"x", u"#fff", u"#000"]],
+         "unread": True, "marked": False, "nested": {"a": {"b": [1, [2, {}]]}}},
+    ]}
+
+    def expected(self, envelope):
+        events = []
+        for key, value in envelope.items():
+            if key == "content" and isinstance(value, list):
+                events.extend(("item", item) for item in value)
+                events.append(("content", None))
+            else:
+                events.append((key, value))
+        return events
+
+    def test_matches_json_loads_for_all_chunk_sizes(self):
+        body = json.dumps(self.ENVELOPE).encode("utf-8")
+        for size in (1, 2, 3, 7, 64, len(body)):
+            self.assertEqual(decode(body, size), self.expected(json.loads(body)))
+
+    def test_escapes_and_split_utf8(self):
+        body = json.dumps(self.ENVELOPE, ensure_ascii=False).encode("utf-8")
+        self.assertEqual(decode(body, 1), self.expected(self.ENVELOPE))
+
+    def test_numbers_split_across_chunks(self):
+        self.assertEqual(decode(b'{"seq": 1234, "content": [56789, true]}', 2),
+                         [("seq", 1234), ("item", 56789), ("item", True), ("content", None)])
+
+    def test_whitespace_and_empty_content(self):
+        self.assertEqual(decode(b' {\n"content" : [ ] ,\t"status":0 } ', 3),
+                         [("content", None), ("status", 0)])
+
+    def test_large_element(self):
+        article = {"id": 1, "content": u"<p class=\"x\">é</p>" * 50000}
+        body = json.dumps({"content": [article]}).encode("utf-8")
+        self.assertEqual(decode(body, 8192), [("item", article), ("content", None)])
+
+    def test_truncated_input(self):
+        body = json.dumps(self.ENVELOPE).encode("utf-8")
+        for end in (0, 1, len(body) // 2, len(body) - 1):
+            self.assertRaises(ValueError, decode, body[:end], 5)
+
+    def test_invalid_input(self):
+        self.assertRaises(ValueError, decode, b'{"content": [1 2]}', 4)
+        self.assertRaises(ValueError, decode, b'["not", "an", "object"]', 4)
+
+    def test_error_response(self):
+        self.assertEqual(decode(b'{"seq": 0, "status": 1, "content": {"error": "NOT_LOGGED_IN"}}', 4),
+                         [("seq", 0), ("status", 1), ("content", {"error": "NOT_LOGGED_IN"})])
+
+class StreamingClientTest(unittest.TestCase):
+    def client(self, headlines):
+        transport = FakeTransport({
+            "login": {"seq": 0, "status": 0,
+                      "content": {"session_id": "sid", "api_level": 14}},
+            "getHeadlines": headlines,
+        })
+        return TinyTinyRSS({"url": "http://localhost/api/", "user": "u", "password": "p"},
+                           transport)
+
+    def test_stream_headlines(self):
+        articles = [{"id": article_id, "title": u"é"} for article_id in range(5)]
+        client = self.client({"seq": 0, "status": 0, "content": articles})
+        self.assertEqual(list(client.getHeadlines(stream=True)), articles)
+
+    def test_iter_headlines_pages(self):
+        articles = [{"id": article_id} for article_id in range(7)]
+        client = self.client(lambda data: {
+            "seq": 0, "status": 0,
+            "content": articles[data.get("skip", 0):data.get("skip", 0) + data["limit"]]})
+        self.assertEqual(list(client.iter_headlines(page_size=3, stream=True)), articles)
+        self.assertEqual(list(client.iter_headlines(page_size=3, stream=True, skip=1, limit=4)),
+                         articles[1:5])
+
+    def test_status_error_raises(self):
+        client = self.client({"seq": 0, "status": 1, "content": {"error": "INCORRECT_USAGE"}})
+        with self.assertRaises(APIError) as context:
+            list(client.getHeadlines(stream=True))
+        self.assertEqual(context.exception.error, "INCORRECT_USAGE")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,22 +6,239 @@
 
     (c) 2017 Andreas Fischer <_@ndreas.de>
 """
+import json
+import os
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
+from responsecache import ResponseCache
+from models import Article, Feed, Category, Label
+from jsonstream import StreamReader
+from resilience import ResiliencePolicy
+
+# Bytes read from the socket at a time when streaming responses.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Operations which are never retried after logging in again.
+SESSION_OPS = ("login", "logout", "isLoggedIn")
+
+class TinyTinyRSSError(Exception):
+    """ Base class of the errors raised by TinyTinyRSS. """
+    pass
+
+class APIError(TinyTinyRSSError):
+    """ Error reported by the server (status 1); 'error' holds its code. """
+    def __init__(self, error):
+        super(APIError, self).__init__("Server Error -- " + error)
+        self.error = error
+
+class TransportError(TinyTinyRSSError):
+    """
+    The server could not be reached or did not send a valid response.
+        * cause - the underlying exception, if any
+        * status - the HTTP status code, if a response was received
+        * sent - False if the request certainly never reached the server
+    """
+    def __init__(self, message, cause=None, status=None, sent=True):
+        super(TransportError, self).__init__(message)
+        self.cause = cause
+        self.status = status
+        self.sent = sent
+
+class CircuitOpenError(TransportError):
+    """ The circuit breaker is open, no request was sent. """
+    def __init__(self):
+        super(CircuitOpenError, self).__init__("Circuit breaker open", sent=False)
+
+def _never_sent(error):
+    """ Return whether requests exception 'error' happened before sending. """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0] if error.args else None, "reason", None)
+        return isinstance(reason, NewConnectionError)
+    return False
+
+class SessionFile(object):
+    """
+    Stores session ids in a JSON file, keyed by server URL and user, so they
+    can be reused across runs instead of logging in every time.
+    """
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path) as sessionfile:
+                return json.load(sessionfile)
+        except (IOError, ValueError):
+            return {}
+
+    def _write(self, sessions):
+        tmp = self.path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as sessionfile:
+            json.dump(sessions, sessionfile)
+        os.rename(tmp, self.path)
+
+    def load(self, url, user):
+        """ Return the stored session for url and user as a dict, or None. """
+        with self.lock:
+            return self._read().get(u"{} {}".format(user, url))
+
+    def save(self, url, user, session):
+        """ Store 'session' (a dict with session_id and api_level). """
+        with self.lock:
+            sessions = self._read()
+            sessions[u"{} {}".format(user, url)] = session
+            self._write(sessions)
+
+    def clear(self, url, user):
+        """ Forget the stored session for url and user. """
+        with self.lock:
+            sessions = self._read()
+            if sessions.pop(u"{} {}".format(user, url), None) is not None:
+                self._write(sessions)
+
+class HTTPTransport(object):
+    """
+    Pooled HTTP transport used by TinyTinyRSS to talk to the API endpoint.
+    A single requests.Session is kept for the lifetime of the transport, so
+    connections (and TLS sessions) are reused across API calls.
+    Parameters:
+        * pool_size (integer) - maximum number of pooled connections per host
+        * connect_timeout (float) - seconds to wait for a connection
+        * read_timeout (float) - seconds to wait for the server to respond
+        * keep_alive (bool) - keep connections open between calls
+        * compress (bool) - ask the server for gzip-compressed responses
+    """
+    def __init__(self, pool_size=10, connect_timeout=10, read_timeout=60,
+                 keep_alive=True, compress=True):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Connection"] = "keep-alive" if keep_alive else "close"
+        self.session.headers["Accept-Encoding"] = "gzip, deflate" if compress else "identity"
+
+    def post(self, url, data, stream=False):
+        """
+        POST the JSON-encoded parameter 'data' to 'url' and return the
+        response. With 'stream' set, the body is not read in advance and can
+        be consumed with the response's iter_content().
+        """
+        return self.session.post(url, json=data, timeout=self.timeout, stream=stream)
+
+    def close(self):
+        """ Close all pooled connections. """
+        self.session.close()
+
+class Prefetch(threading.Thread):
+    """ Run func(*args) in a background thread until result() is requested. """
+    def __init__(self, func, *args):
+        super(Prefetch, self).__init__()
+        self.daemon = True
+        self.func = func
+        self.args = args
+        self.value = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args)
+        except Exception as error: # pylint: disable=broad-except
+            self.error = error
+
+    def result(self):
+        """ Wait for the call to finish and return its value (or raise its error). """
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
 
 class TinyTinyRSS(object):
-    """ This class is a wrapper around the TinyTinyRSS REST API. """
-    def __init__(self, conn):
+    """
+    This class is a wrapper around the TinyTinyRSS REST API.
+    Besides 'url', 'user' and 'password', 'conn' may contain a 'transport'
+    dict of keyword arguments for HTTPTransport. Alternatively, any object
+    providing post(url, data, stream=False) and close() can be passed as
+    'transport'.
+    Caching of metadata calls is enabled by passing a ResponseCache as
+    'cache', or a dict of keyword arguments for it as conn['cache'].
+    Callables in 'pre_hooks' are called as hook(op, data) before, those in
+    'post_hooks' as hook(call) after each request to the server, where
+    'call' is a dict with the keys op, params, start, duration, bytes and
+    status ("ok", "error" for API errors or "exception" for transport
+    errors). See the instrumentation module for ready-made hooks.
+    Sessions are reused across runs by passing a SessionFile as
+    'session_file', or its path as conn['session_file']: a stored session
+    id is used if isLoggedIn confirms it, and the session is kept open when
+    leaving a with block. Whenever the server reports NOT_LOGGED_IN (e.g.
+    after the session expired), the client logs in again and repeats the
+    call.
+    Failed requests are retried and a failing server is given a rest
+    according to a ResiliencePolicy passed as 'policy', or a dict of keyword
+    arguments for it as conn['policy']; without one, every call is tried
+    once. Server errors are raised as APIError, network and HTTP errors as
+    TransportError.
+    """
+    def __init__(self, conn, transport=None, cache=None, session_file=None, policy=None):
         self.url = conn['url']
+        self.user = conn['user']
+        self.password = conn['password']
         self.session_id = None
         self.api_level = None
-        self.login(conn['user'], conn['password'])
+        self.transport = transport or HTTPTransport(**conn.get('transport', {}))
+        if cache is None and conn.get('cache') is not None:
+            cache = ResponseCache(**conn['cache'])
+        self.cache = cache
+        if session_file is None and conn.get('session_file'):
+            session_file = SessionFile(conn['session_file'])
+        self.session_file = session_file
+        if policy is None and conn.get('policy') is not None:
+            policy = ResiliencePolicy(**conn['policy'])
+        self.policy = policy
+        self.login_lock = threading.Lock()
+        self.pre_hooks = []
+        self.post_hooks = []
+        if not self._resume_session():
+            self.login(self.user, self.password)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if self.session_id:
+        if self.session_id and self.session_file is None:
             self.logout()
+        else:
+            self.transport.close()
+
+    def _resume_session(self):
+        if self.session_file is None:
+            return False
+        session = self.session_file.load(self.url, self.user)
+        if not session:
+            return False
+        self.session_id = session.get('session_id')
+        self.api_level = session.get('api_level')
+        try:
+            if self.isLoggedIn():
+                return True
+        except APIError:
+            pass
+        self.session_id = None
+        return False
+
+    def _relogin(self, failed_session_id):
+        """ Log in again, unless another thread already did. """
+        with self.login_lock:
+            if self.session_id == failed_session_id:
+                self.login(self.user, self.password)
 
     def _handle_id_list(self, id_list):
         strlist = None
@@ -34,14 +251,191 @@ class TinyTinyRSS(object):
 
     def rest(self, data):
         """ Execute a single REST call to the API with JSON-encoded parameter 'data'."""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return self._rest_session(data)
+            except TransportError as error:
+                self._retry_wait(data, error, attempt)
+
+    def _retry_wait(self, data, error, attempt):
+        """ Sleep before the next attempt, or re-raise 'error' to give up. """
+        if self.policy is None or isinstance(error, CircuitOpenError):
+            raise error
+        self.policy.failure()
+        delay = self.policy.retry_delay(data, error, attempt)
+        if delay is None:
+            raise error
+        time.sleep(delay)
+
+    def _rest_session(self, data):
+        session_id = self.session_id
+        try:
+            return self._rest(data)
+        except APIError as error:
+            if error.error != "NOT_LOGGED_IN" or data.get("op") in SESSION_OPS:
+                raise
+        self._relogin(session_id)
+        return self._rest(data)
+
+    def _post(self, data, stream=False):
+        """ Send 'data' through the transport, raising TransportError on failure. """
+        if self.policy is not None and not self.policy.allow():
+            raise CircuitOpenError()
+        try:
+            if stream:
+                req = self.transport.post(self.url, data, stream=True)
+            else:
+                req = self.transport.post(self.url, data)
+        except requests.RequestException as error:
+            raise TransportError(str(error), error, sent=not _never_sent(error))
+        status = getattr(req, "status_code", 200)
+        if status >= 400:
+            req.close()
+            raise TransportError("HTTP Error {}".format(status), status=status)
+        return req
+
+    def _reached_server(self):
+        """
+        Record a response from the server (even an API error such as
+        NOT_LOGGED_IN) with the circuit breaker.
+        """
+        if self.policy is not None:
+            self.policy.success()
+
+    def _rest(self, data):
+        op = data.get("op")
+        key = self.cache.key(data) if self.cache is not None else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
         if self.session_id:
             data["sid"] = self.session_id
-        req = requests.get(self.url, json=data)
-        data = req.json()
+        for hook in self.pre_hooks:
+            hook(op, data)
+        start = time.time()
+        try:
+            req = self._post(data)
+            try:
+                resp = req.json()
+            except ValueError as error:
+                raise TransportError("Invalid response: {}".format(error), error)
+            self._reached_server()
+        except Exception:
+            self._post_hooks(op, data, start, 0, "exception")
+            raise
+        status = "error" if resp['status'] == 1 else "ok"
+        self._post_hooks(op, data, start, len(req.content), status)
+        data = resp
         if data['status'] == 1:
-            raise Exception("Server Error -- " + data['content']['error'])
+            raise APIError(data['content']['error'])
+        if self.cache is not None:
+            if key is not None:
+                self.cache.put(key, op, data)
+            else:
+                self.cache.written(op)
         return data
 
+    def iter_rest(self, data):
+        """
+        Like rest(), but decode the response while it is being received and
+        yield the elements of its 'content' array one by one, so only one
+        element has to be held in memory at a time. Server errors are raised
+        as soon as they are detected. Responses are not cached.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            yielded = False
+            try:
+                for item in self._iter_rest_session(data):
+                    yielded = True
+                    yield item
+            except TransportError as error:
+                if yielded:
+                    if self.policy is not None:
+                        self.policy.failure()
+                    raise
+                self._retry_wait(data, error, attempt)
+                continue
+            return
+
+    def _iter_rest_session(self, data):
+        session_id = self.session_id
+        try:
+            for item in self._iter_rest(data):
+                yield item
+            return
+        except APIError as error:
+            # Errors are reported before any content, so nothing was yielded.
+            if error.error != "NOT_LOGGED_IN" or data.get("op") in SESSION_OPS:
+                raise
+        self._relogin(session_id)
+        for item in self._iter_rest(data):
+            yield item
+
+    def _iter_rest(self, data):
+        op = data.get("op")
+        if self.session_id:
+            data["sid"] = self.session_id
+        for hook in self.pre_hooks:
+            hook(op, data)
+        start = time.time()
+        status = "exception"
+        reader = None
+        req = None
+        try:
+            req = self._post(data, stream=True)
+            self._reached_server()
+            reader = StreamReader(req.iter_content(STREAM_CHUNK_SIZE))
+            api_status, content = None, None
+            for key, value in self._events(reader):
+                if key == "item":
+                    yield value
+                elif key == "status":
+                    api_status = value
+                elif key == "content":
+                    content = value
+                if api_status == 1 and content is not None:
+                    status = "error"
+                    raise APIError(content['error'])
+            status = "ok"
+        except GeneratorExit:
+            status = "ok"
+            raise
+        finally:
+            if req is not None:
+                req.close()
+            self._post_hooks(op, data, start, reader.bytes if reader else 0, status)
+
+    @staticmethod
+    def _events(reader):
+        """ Iterate over reader.events(), raising TransportError on failure. """
+        events = reader.events()
+        while True:
+            try:
+                event = next(events)
+            except StopIteration:
+                return
+            except (requests.RequestException, ValueError) as error:
+                raise TransportError("Invalid response: {}".format(error), error)
+            yield event
+
+    def _iter_content(self, req, model):
+        for item in self.iter_rest(req):
+            yield model(item) if model is not None else item
+
+    def _post_hooks(self, op, data, start, size, status):
+        if not self.post_hooks:
+            return
+        call = {"op": op, "params": data, "start": start,
+                "duration": time.time() - start, "status": status,
+                "bytes": size}
+        for hook in self.post_hooks:
+            hook(call)
+
     def getApiLevel(self):
         """
         Return an abstracted integer API version level, increased with each API
@@ -78,13 +472,22 @@ class TinyTinyRSS(object):
         resp = self.rest(req)
         self.session_id = resp['content']['session_id']
         self.api_level = resp['content']['api_level']
+        if self.session_file is not None:
+            self.session_file.save(self.url, user, {"session_id": self.session_id,
+                                                    "api_level": self.api_level})
 
     def logout(self):
         """
-        Closes your login session.
+        Closes your login session and the underlying transport.
         """
         req = {"op": "logout"}
-        self.rest(req)
+        try:
+            self.rest(req)
+        finally:
+            self.session_id = None
+            self.transport.close()
+            if self.session_file is not None:
+                self.session_file.clear(self.url, self.user)
 
     def isLoggedIn(self):
         """
@@ -111,7 +514,7 @@ class TinyTinyRSS(object):
         return self.rest(req)['content']
 
     def getFeeds(self, cat_id=None, unread_only=None, limit=None, offset=None,
-            include_nested=None):
+            include_nested=None, as_objects=False):
         """
         Returns JSON-encoded list of feeds. The list includes category id,
         title, feed url, etc.
@@ -122,6 +525,7 @@ class TinyTinyRSS(object):
             * offset (integer) - skip this amount of feeds first
             * include_nested (bool) - include child categories (as Feed objects
               with is_cat set) requires version:1.6.0
+            * as_objects (bool) - return models.Feed objects instead of dicts
         Pagination:
         Limit and offset are useful if you need feedlist pagination. If you use
         them, you shouldn’t filter by unread, handle filtering in your app
@@ -136,12 +540,13 @@ class TinyTinyRSS(object):
         Known bug: Prior to version:1.5.0 passing null or 0 cat_id to this
         method returns full list of feeds instead of Uncategorized feeds only.
         """
-        req = {k: v for k, v in locals().iteritems() if v and k != "self"}
+        req = {k: v for k, v in locals().iteritems() if v and k not in ("self", "as_objects")}
         req["op"] = "getFeeds"
-        return self.rest(req)['content']
+        feeds = self.rest(req)['content']
+        return Feed.from_list(feeds) if as_objects else feeds
 
     def getCategories(self, unread_only=None, enable_nested=None,
-            include_empty=None):
+            include_empty=None, as_objects=False):
         """
         Returns JSON-encoded list of categories with unread counts.
             * unread_only (bool) - only return categories which have unread
@@ -150,6 +555,8 @@ class TinyTinyRSS(object):
               topmost categories requires version:1.6.0
             * include_empty (bool) - include empty categories requires
               version:1.7.6
+            * as_objects (bool) - return models.Category objects instead of
+              dicts
         Nested mode in this case means that a flat list of only topmost
         categories is returned and unread counters include counters for child
         categories.
@@ -157,16 +564,18 @@ class TinyTinyRSS(object):
         (for backwards compatibility) or topmost categories, use getFeeds to
         traverse deeper.
         """
-        req = {k: v for k, v in locals().iteritems() if v and k != "self"}
+        req = {k: v for k, v in locals().iteritems() if v and k not in ("self", "as_objects")}
         req["op"] = "getCategories"
-        return self.rest(req)['content']
+        categories = self.rest(req)['content']
+        return Category.from_list(categories) if as_objects else categories
 
     def getHeadlines(self, feed_id=None, limit=None, skip=None, filter=None,
             is_cat=None, show_excerpt=None, show_content=None, view_mode=None,
             include_attachments=None, since_id=None, include_nested=None,
             order_by=None, sanitize=True, force_update=False,
             has_sandbox=False, include_header=None, search=None,
-            search_mode="this_feed", match_on=None):
+            search_mode="this_feed", match_on=None, as_objects=False,
+            stream=False):
         """
         Returns JSON-encoded list of headlines.
         Parameters:
@@ -203,6 +612,10 @@ class TinyTinyRSS(object):
             * search_mode (string) - all_feeds, this_feed (default),
               this_cat (category containing requested feed)
             * match_on (string) - ignored
+        With as_objects set, models.Article objects are returned instead of
+        dicts. With stream set, an iterator is returned which decodes and
+        yields the headlines one by one as they are received (include_header
+        is not supported then).
         Special feed IDs are as follows:
             -1 starred
             -2 published
@@ -215,9 +628,93 @@ class TinyTinyRSS(object):
             * feed_dates - newest first, goes by feed date
             * (nothing) - default
         """
-        req = {k: v for k, v in locals().iteritems() if v and k != "self"}
+        req = {k: v for k, v in locals().iteritems()
+               if v and k not in ("self", "as_objects", "stream")}
         req["op"] = "getHeadlines"
-        return self.rest(req)['content']
+        if stream:
+            req.pop("include_header", None)
+            return self._iter_content(req, Article if as_objects else None)
+        headlines = self.rest(req)['content']
+        if as_objects:
+            if include_header:
+                return [headlines[0], Article.from_list(headlines[1])]
+            return Article.from_list(headlines)
+        return headlines
+
+    def iter_headlines(self, page_size=200, prefetch=True, **kwargs):
+        """
+        Lazily iterate over all headlines matching the getHeadlines parameters
+        in 'kwargs', paging past the 200 article cap using skip.
+        Parameters:
+            * page_size (integer) - articles per request (at most 200)
+            * prefetch (bool) - fetch the next page in the background while
+              the current one is being consumed
+            * limit (integer) - stop after this many articles (default: all)
+            * skip (integer) - start at this offset
+            * stream (bool) - decode each page while it is being received
+              (see getHeadlines) instead of prefetching the next one
+        Only the current and the next page are held in memory. Articles
+        showing up twice across a page boundary (e.g. when new articles
+        arrive during iteration) are only yielded once. include_header is
+        not supported.
+        """
+        page_size = min(page_size, 200)
+        limit = kwargs.pop("limit", None)
+        offset = kwargs.pop("skip", None) or 0
+        kwargs.pop("include_header", None)
+        if kwargs.pop("stream", False):
+            return self._stream_headlines(page_size, limit, offset, kwargs)
+        return self._page_headlines(page_size, prefetch, limit, offset, kwargs)
+
+    def _page_headlines(self, page_size, prefetch, limit, offset, kwargs):
+        def fetch(skip):
+            return self.getHeadlines(limit=page_size, skip=skip, **kwargs)
+
+        page = fetch(offset)
+        previous_ids = set()
+        while page:
+            offset += len(page)
+            fresh = [article for article in page if article['id'] not in previous_ids]
+            previous_ids = set(article['id'] for article in page)
+            if limit is not None:
+                fresh = fresh[:limit]
+                limit -= len(fresh)
+            upcoming = None
+            if len(page) >= page_size and limit != 0:
+                upcoming = Prefetch(fetch, offset) if prefetch else offset
+            page = None
+            try:
+                for article in fresh:
+                    yield article
+            except GeneratorExit:
+                # Closed early: let a running prefetch finish before the
+                # caller goes on to log out and close the transport.
+                if prefetch and upcoming is not None:
+                    upcoming.join()
+                raise
+            if upcoming is not None:
+                page = upcoming.result() if prefetch else fetch(upcoming)
+
+    def _stream_headlines(self, page_size, limit, offset, kwargs):
+        previous_ids = set()
+        while limit != 0:
+            count = 0
+            current_ids = set()
+            for article in self.getHeadlines(limit=page_size, skip=offset,
+                                             stream=True, **kwargs):
+                count += 1
+                current_ids.add(article['id'])
+                if article['id'] in previous_ids:
+                    continue
+                yield article
+                if limit is not None:
+                    limit -= 1
+                    if limit == 0:
+                        break
+            if count < page_size:
+                break
+            offset += count
+            previous_ids = current_ids
 
     def updateArticle(self, article_ids, mode, field, data=None):
         """
@@ -240,16 +737,25 @@ class TinyTinyRSS(object):
         req["article_ids"] = self._handle_id_list(article_ids)
         return self.rest(req)['content']['updated'] if req["article_ids"] else 0
 
-    def getArticle(self, article_id):
+    def getArticle(self, article_id, as_objects=False, stream=False):
         """
         Requests JSON-encoded article object with specific ID.
             * article_id (integer) - article ID to return as of 15.10.2010 git
             or version:1.5.0 supports comma-separated list of IDs
+            * as_objects (bool) - return models.Article objects instead of
+              dicts
+            * stream (bool) - return an iterator yielding the articles one by
+              one as they are received
         Since version:1.4.3 also returns article attachments.
         """
         req = {"op": "getArticle"}
         req["article_id"] = self._handle_id_list(article_id)
-        return self.rest(req)['content'] if req["article_id"] else None
+        if not req["article_id"]:
+            return iter(()) if stream else None
+        if stream:
+            return self._iter_content(req, Article if as_objects else None)
+        articles = self.rest(req)['content']
+        return Article.from_list(articles) if as_objects else articles
 
     def getConfig(self):
         """
@@ -271,7 +777,7 @@ class TinyTinyRSS(object):
         aborted by the HTTP server.
             * feed_id (integer) - ID of feed to update
         """
-        req = {"op": "getConfig", "feed_id": feed_id}
+        req = {"op": "updateFeed", "feed_id": feed_id}
         self.rest(req)
 
     def getPref(self, pref_name):
@@ -292,18 +798,20 @@ class TinyTinyRSS(object):
         req = {"op": "catchupFeed", "feed_id": feed_id, "is_cat": is_cat}
         self.rest(req)
 
-    def getLabels(self, article_id=None):
+    def getLabels(self, article_id=None, as_objects=False):
         """
         Returns list of configured labels, as an array of label objects:
         {"id":2,"caption":"Debian","fg_color":"#e14a00","bg_color":"#ffffff","checked":false},
         Parameters:
             * article_id (int) - set “checked” to true if specified article id
             has returned label.
+            * as_objects (bool) - return models.Label objects instead of dicts
         """
         req = {"op": "getLabels"}
         if article_id:
             req["article_id"] = article_id
-        return self.rest(req)['content']
+        labels = self.rest(req)['content']
+        return Label.from_list(labels) if as_objects else labels
 
     def setArticleLabel(self, article_ids, label_id, assign):
         """
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    This module provides WriteQueue, a write-behind queue which coalesces
+    updateArticle and setArticleLabel calls and sends them in bounded chunks.
+
+    (c) 2017 Andreas Fischer <_@ndreas.de>
+"""
+import threading
+import time
+
+class WriteQueue(object):
+    """
+    Collects article updates and label assignments and sends them to the
+    server in batches.
+    Pending article ids are kept in sets per (mode, field, data) for
+    updateArticle and per (label_id, assign) for setArticleLabel, so
+    duplicates are only sent once; a later update of the same field (or
+    label) of an article replaces an earlier pending one.
+    Parameters:
+        * ttrss - TinyTinyRSS instance to send the updates through
+        * chunk_size (integer) - maximum number of ids per request
+        * max_pending (integer) - flush once this many ids are pending
+        * max_delay (float) - flush (from a timer thread) once the oldest
+          pending update is this many seconds old
+    Either threshold can be disabled by setting it to None.
+    The queue is flushed when leaving a with block. If a timed flush fails,
+    the updates stay queued and are retried after another max_delay.
+    """
+    def __init__(self, ttrss, chunk_size=200, max_pending=1000, max_delay=30):
+        self.ttrss = ttrss
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.updates = {}
+        self.labels = {}
+        self.since = None
+        self.timer = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def __len__(self):
+        return (sum(len(ids) for ids in self.updates.values()) +
+                sum(len(ids) for ids in self.labels.values()))
+
+    def _as_set(self, article_ids):
+        if hasattr(article_ids, "__iter__"):
+            return set(article_ids)
+        return set([article_ids])
+
+    def updateArticle(self, article_ids, mode, field, data=None):
+        """
+        Queue an updateArticle call (see TinyTinyRSS.updateArticle).
+        Toggles (mode 2) cannot be coalesced; pending updates are flushed and
+        the toggle is sent right away.
+        """
+        article_ids = self._as_set(article_ids)
+        if mode == 2:
+            self.flush()
+            return sum(self.ttrss.updateArticle(chunk, mode, field, data)
+                       for chunk in self._chunks(article_ids))
+        with self.lock:
+            for key, ids in self.updates.items():
+                if key[1] == field:
+                    ids -= article_ids
+            self.updates.setdefault((mode, field, data), set()).update(article_ids)
+            self._touch()
+        self._maybe_flush()
+
+    def setArticleLabel(self, article_ids, label_id, assign):
+        """ Queue a setArticleLabel call (see TinyTinyRSS.setArticleLabel). """
+        article_ids = self._as_set(article_ids)
+        with self.lock:
+            self.labels.setdefault((label_id, not assign), set()).difference_update(article_ids)
+            self.labels.setdefault((label_id, assign), set()).update(article_ids)
+            self._touch()
+        self._maybe_flush()
+
+    def _touch(self):
+        """ Note the time of the oldest pending update and start the flush timer. """
+        if self.since is None:
+            self.since = time.time()
+            if self.max_delay is not None:
+                self.timer = threading.Timer(self.max_delay, self._timed_flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except Exception: # pylint: disable=broad-except
+            pass # requeued by flush(), retried by the next timer
+
+    def _maybe_flush(self):
+        if self.max_pending is not None and len(self) >= self.max_pending:
+            self.flush()
+
+    def _chunks(self, ids):
+        ids = sorted(ids)
+        for start in range(0, len(ids), self.chunk_size):
+            yield ids[start:start + self.chunk_size]
+
+    def flush(self):
+        """
+        Send all pending updates. Returns the number of articles updated as
+        reported by the server. If a request fails, the ids not yet sent are
+        queued again before the error is raised.
+        """
+        with self.flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self.lock:
+            updates, self.updates = self.updates, {}
+            labels, self.labels = self.labels, {}
+            self.since = None
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        updated = 0
+        try:
+            while updates:
+                (mode, field, data), ids = updates.popitem()
+                for chunk in self._chunks(ids):
+                    try:
+                        updated += self.ttrss.updateArticle(chunk, mode, field, data)
+                    except Exception:
+                        updates[(mode, field, data)] = ids
+                        raise
+                    ids.difference_update(chunk)
+            while labels:
+                (label_id, assign), ids = labels.popitem()
+                for chunk in self._chunks(ids):
+                    try:
+                        self.ttrss.setArticleLabel(chunk, label_id, assign)
+                    except Exception:
+                        labels[(label_id, assign)] = ids
+                        raise
+                    ids.difference_update(chunk)
+        except Exception:
+            self._requeue(updates, labels)
+            raise
+        return updated
+
+    def _requeue(self, updates, labels):
+        with self.lock:
+            for key, ids in updates.items():
+                ids.update(self.updates.get(key, ()))
+                self.updates[key] = ids
+            for key, ids in labels.items():
+                ids.update(self.labels.get(key, ()))
+                self.labels[key] = ids
+            self._touch()